@@ -0,0 +1,94 @@
+import os
+import logging
+from typing import Optional
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg_pool import AsyncConnectionPool
+
+# --- Pool Configuration ---
+DATABASE_URL = os.getenv("DATABASE_URL")
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "30"))       # seconds to wait for a free connection
+PG_POOL_MAX_IDLE = float(os.getenv("PG_POOL_MAX_IDLE", "300"))    # close idle connections above min_size
+
+# Process-wide singletons, created once by the FastAPI lifespan (see backend/main.py)
+_pool: Optional[AsyncConnectionPool] = None
+_checkpointer: Optional[AsyncPostgresSaver] = None
+
+
+async def open_checkpointer() -> Optional[AsyncPostgresSaver]:
+    """
+    Opens the shared Postgres pool and creates the LangGraph checkpointer.
+    Checkpoint tables are set up here, once per process, instead of on every chat turn.
+    Returns None (stateless mode) when DATABASE_URL is not configured.
+    """
+    global _pool, _checkpointer
+    if _checkpointer is not None:
+        return _checkpointer
+    if not DATABASE_URL:
+        logging.warning("DATABASE_URL not set. Chat will run stateless.")
+        return None
+
+    _pool = AsyncConnectionPool(
+        conninfo=DATABASE_URL,
+        min_size=PG_POOL_MIN_SIZE,
+        max_size=PG_POOL_MAX_SIZE,
+        timeout=PG_POOL_TIMEOUT,
+        max_idle=PG_POOL_MAX_IDLE,
+        # Validate connections on checkout so dropped Supabase connections are replaced transparently
+        check=AsyncConnectionPool.check_connection,
+        kwargs={"autocommit": True, "prepare_threshold": 0},
+        name="checkpointer",
+        open=False,
+    )
+    try:
+        await _pool.open(wait=True, timeout=PG_POOL_TIMEOUT)
+        _checkpointer = AsyncPostgresSaver(_pool)
+        await _checkpointer.setup()
+    except Exception:
+        # Don't leave an open pool behind when the app falls back to stateless mode
+        await close_checkpointer()
+        raise
+    logging.info(f"Checkpointer ready (pool min={PG_POOL_MIN_SIZE}, max={PG_POOL_MAX_SIZE})")
+    return _checkpointer
+
+
+async def close_checkpointer() -> None:
+    global _pool, _checkpointer
+    if _pool is not None:
+        await _pool.close()
+    _pool = None
+    _checkpointer = None
+
+
+def get_checkpointer() -> Optional[AsyncPostgresSaver]:
+    """Returns the shared checkpointer, or None when running stateless."""
+    return _checkpointer
+
+
+def get_pool() -> Optional[AsyncConnectionPool]:
+    return _pool
+
+
+def get_pool_stats() -> dict:
+    """
+    Pool statistics (psycopg_pool counters such as pool_size, pool_available, requests_waiting).
+    """
+    if _pool is None:
+        return {"status": "disabled"}
+    stats = _pool.get_stats()
+    stats.update({"name": _pool.name, "min_size": _pool.min_size, "max_size": _pool.max_size})
+    return stats
+
+
+async def check_health() -> dict:
+    """Runs a trivial query through the pool and reports its status with pool statistics."""
+    if _pool is None:
+        return {"status": "disabled"}
+    try:
+        async with _pool.connection(timeout=5) as conn:
+            await conn.execute("SELECT 1")
+        return {"status": "ok", "pool": get_pool_stats()}
+    except Exception as e:
+        logging.error(f"Checkpointer pool health check failed: {e}")
+        return {"status": "error", "detail": str(e), "pool": get_pool_stats()}
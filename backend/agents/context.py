@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
+from backend.chunking import count_tokens, truncate_tokens  # count_tokens re-exported for nodes
+
+# --- Context Budget ---
+# AgentState.messages only grows (operator.add). Nodes don't send it as is: they send the
+# rolling summary of older turns (state["summary"], covering messages[:summary_upto]) plus
+# as many recent messages as fit in the model's budget, with old tool outputs truncated.
+# The compact node refreshes the summary when the unsummarized part gets too large.
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "6000"))
+# Per-model overrides, e.g. '{"llama3": 6000, "gpt-4o": 100000}'
+CONTEXT_BUDGETS: Dict[str, int] = json.loads(os.getenv("CONTEXT_BUDGETS", "{}"))
+CONTEXT_TOOL_OUTPUT_MAX_TOKENS = int(os.getenv("CONTEXT_TOOL_OUTPUT_MAX_TOKENS", "400"))
+CONTEXT_KEEP_RECENT = int(os.getenv("CONTEXT_KEEP_RECENT", "4"))           # never summarized, tool output kept whole
+CONTEXT_SUMMARY_TRIGGER = float(os.getenv("CONTEXT_SUMMARY_TRIGGER", "0.75"))  # fraction of the budget
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "400"))
+
+TOOL_RESULT_MARKER = "[Tool Result]:"
+_NOTE_TOKENS = 16   # room for a "[... truncated ...]" note
+
+
+def get_budget(llm: Any) -> int:
+    model = getattr(llm, "model_name", None) or getattr(getattr(llm, "bound", None), "model_name", None)
+    return CONTEXT_BUDGETS.get(model, CONTEXT_MAX_TOKENS)
+
+
+def message_tokens(message: BaseMessage) -> int:
+    # ~4 tokens of per-message overhead in chat formats
+    return count_tokens(str(message.content)) + 4
+
+
+def _truncate(text: str, max_tokens: int, what: str) -> str:
+    """`text` cut to about `max_tokens` tokens, including a note saying how much was cut."""
+    kept = truncate_tokens(text, max_tokens - _NOTE_TOKENS).rstrip()
+    return f"{kept}\n[... {what} truncated, {len(text) - len(kept)} characters omitted]"
+
+
+def truncate_tool_output(message: BaseMessage, max_tokens: int = CONTEXT_TOOL_OUTPUT_MAX_TOKENS) -> BaseMessage:
+    """Shortens the `[Tool Result]:` part of a worker message, keeping its head."""
+    content = str(message.content)
+    if TOOL_RESULT_MARKER not in content:
+        return message
+    head, result = content.split(TOOL_RESULT_MARKER, 1)
+    if count_tokens(result) <= max_tokens:
+        return message
+    return message.model_copy(update={"content": f"{head}{TOOL_RESULT_MARKER}{_truncate(result, max_tokens, 'tool output')}"})
+
+
+def fit_message(message: BaseMessage, max_tokens: int, truncate_content: bool = True) -> BaseMessage:
+    """
+    The message shortened to at most `max_tokens` (as counted by message_tokens): its tool
+    output first, then, if that isn't enough and `truncate_content` is set, its content.
+    """
+    tokens = message_tokens(message)
+    if tokens <= max_tokens:
+        return message
+    content = str(message.content)
+    if TOOL_RESULT_MARKER in content:
+        room = count_tokens(content.split(TOOL_RESULT_MARKER, 1)[1]) - (tokens - max_tokens)
+        if room > _NOTE_TOKENS:
+            shortened = truncate_tool_output(message, room)
+            if message_tokens(shortened) <= max_tokens:
+                return shortened
+            message = shortened
+    if not truncate_content:
+        return message
+    return message.model_copy(update={"content": _truncate(content, max_tokens - 4, "message")})
+
+
+def fit_messages(messages: List[BaseMessage], max_tokens: int) -> List[BaseMessage]:
+    """
+    `messages` with their tool outputs shortened so that together they take at most
+    `max_tokens`: each tool output gets an equal share of what the other messages leave.
+    """
+    if sum(message_tokens(m) for m in messages) <= max_tokens:
+        return messages
+    with_output = [TOOL_RESULT_MARKER in str(m.content) for m in messages]
+    fixed = sum(message_tokens(m) for m, has_output in zip(messages, with_output) if not has_output)
+    share = (max_tokens - fixed) // max(sum(with_output), 1)
+    return [fit_message(m, share, truncate_content=False) if has_output else m for m, has_output in zip(messages, with_output)]
+
+
+def _split(state: Dict[str, Any]):
+    """(latest system message from the caller, unsummarized non-system messages)."""
+    messages = state["messages"]
+    system = next((m for m in reversed(messages) if isinstance(m, SystemMessage)), None)
+    upto = state.get("summary_upto") or 0
+    rest = [m for m in messages[upto:] if not isinstance(m, SystemMessage)]
+    return system, rest
+
+
+def bounded_messages(state: Dict[str, Any], llm: Any, reserve_tokens: int = 0) -> List[BaseMessage]:
+    """
+    The message list a node should send: caller's system message, rolling summary, then the
+    newest messages that fit in the model's budget minus `reserve_tokens` (the node's own prompt).
+    A message that doesn't fit whole has its tool output cut to what is left. The newest
+    message is always included, shortened to the budget if needed.
+    """
+    system, rest = _split(state)
+    head: List[BaseMessage] = []
+    if system is not None:
+        head.append(system)
+    if state.get("summary"):
+        head.append(SystemMessage(content=f"Summary of the earlier conversation:\n{state['summary']}"))
+
+    budget = get_budget(llm) - reserve_tokens - sum(message_tokens(m) for m in head)
+    kept: List[BaseMessage] = []
+    for i, message in enumerate(reversed(rest)):
+        if i >= CONTEXT_KEEP_RECENT:
+            message = truncate_tool_output(message)
+        tokens = message_tokens(message)
+        if tokens > budget:
+            message = fit_message(message, budget, truncate_content=not kept)
+            tokens = message_tokens(message)
+            if tokens > budget:
+                break
+        kept.append(message)
+        budget -= tokens
+    return head + list(reversed(kept))
+
+
+def needs_compaction(state: Dict[str, Any], llm: Any) -> bool:
+    _, rest = _split(state)
+    if len(rest) <= CONTEXT_KEEP_RECENT:
+        return False
+    return sum(message_tokens(m) for m in rest) > get_budget(llm) * CONTEXT_SUMMARY_TRIGGER
+
+
+async def compact(state: Dict[str, Any], llm: Any) -> Dict[str, Any]:
+    """
+    Folds everything but the last CONTEXT_KEEP_RECENT messages into the rolling summary.
+    Returns the state update ({} if the context is still small enough).
+    """
+    if not needs_compaction(state, llm):
+        return {}
+    messages = state["messages"]
+    new_upto = len(messages) - CONTEXT_KEEP_RECENT
+    upto = state.get("summary_upto") or 0
+    if new_upto <= upto:
+        return {}
+    to_fold = [truncate_tool_output(m) for m in messages[upto:new_upto] if not isinstance(m, SystemMessage)]
+    transcript = "\n".join(f"{getattr(m, 'name', None) or m.type}: {m.content}" for m in to_fold)
+
+    prompt = (
+        "Update the running summary of a multi-agent conversation with the new messages. "
+        "Keep the user's goals, decisions, file names, identifiers and open issues; drop chit-chat. "
+        "Reply with the updated summary only."
+    )
+    request = f"Current summary:\n{state.get('summary') or '(none)'}\n\nNew messages:\n{transcript}"
+    try:
+        response = await llm.ainvoke(
+            [SystemMessage(content=prompt), HumanMessage(content=request)],
+            max_tokens=CONTEXT_SUMMARY_MAX_TOKENS,
+        )
+    except Exception as e:
+        # Nodes still trim to the budget, so a failed summary only loses older detail
+        logging.error(f"Context compaction failed: {e}")
+        return {}
+    logging.info(f"Context: summarized messages {upto}-{new_upto}")
+    return {"summary": str(response.content).strip(), "summary_upto": new_upto}
@@ -1,11 +1,13 @@
+from functools import lru_cache
 from langgraph.graph import StateGraph, END
 from backend.agents.state import AgentState
-from backend.agents.nodes import supervisor_node, researcher_node, developer_node, reviewer_node
+from backend.agents.nodes import supervisor_node, researcher_node, developer_node, reviewer_node, compact_node
 
 # 1. Initialize Graph
 workflow = StateGraph(AgentState)
 
 # 2. Add Nodes
+workflow.add_node("compact", compact_node)
 workflow.add_node("supervisor", supervisor_node)
 workflow.add_node("Researcher", researcher_node)
 workflow.add_node("Developer", developer_node)
@@ -24,16 +26,20 @@ workflow.add_conditional_edges(
     }
 )
 
-# From workers, we always go back to supervisor to report results and get next assignment
-workflow.add_edge("Researcher", "supervisor")
-workflow.add_edge("Developer", "supervisor")
-workflow.add_edge("Reviewer", "supervisor")
+# From workers, we always go back to supervisor to report results and get next assignment,
+# through the compact node (keeps the context within the model's token budget)
+workflow.add_edge("Researcher", "compact")
+workflow.add_edge("Developer", "compact")
+workflow.add_edge("Reviewer", "compact")
+workflow.add_edge("compact", "supervisor")
 
 # 4. Set Entry Point
-workflow.set_entry_point("supervisor")
+workflow.set_entry_point("compact")
 
 # 5. Compile
-# We export a helper to compile with a checkpointer if needed
+# We export a helper to compile with a checkpointer if needed.
+# Compiled graphs are memoized per checkpointer, since the checkpointer is a process-wide singleton.
+@lru_cache(maxsize=8)
 def get_graph(checkpointer=None):
     return workflow.compile(checkpointer=checkpointer)
 
@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List
+from langchain_core.messages import AIMessage, BaseMessage
+from backend.cache import TTLCache, SQLiteCache
+
+# --- LLM Response Cache ---
+# Exact-match cache for deterministic (temperature 0) calls, keyed by hash(model, params,
+# normalized messages). Opt-in per graph node: LLM_CACHE_NODES is a comma-separated list
+# of node names ("" disables the cache). Only the response text is cached, so cached
+# calls don't stream tokens; enable it for nodes whose output isn't streamed.
+LLM_CACHE_NODES = {n.strip() for n in os.getenv("LLM_CACHE_NODES", "supervisor").split(",") if n.strip()}
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "backend/.cache/llm_responses.sqlite")   # "" = memory only
+LLM_CACHE_DISK_MAX_ROWS = int(os.getenv("LLM_CACHE_DISK_MAX_ROWS", "10000"))
+
+_memory_cache = TTLCache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+_disk_cache = SQLiteCache(
+    LLM_CACHE_PATH, table="llm_responses", maxsize=LLM_CACHE_DISK_MAX_ROWS, ttl=LLM_CACHE_TTL,
+) if LLM_CACHE_PATH else None
+# Per-node counters; saved_ms is the latency of the original calls that hits avoided
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _node_stats(node: str) -> Dict[str, float]:
+    return _stats.setdefault(node, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "saved_ms": 0.0})
+
+
+def _model_params(llm: Any) -> Dict[str, Any]:
+    """Everything about the model that changes its output (unwrapping bound runnables)."""
+    params: Dict[str, Any] = {}
+    while hasattr(llm, "bound"):
+        params.update(getattr(llm, "kwargs", None) or {})
+        llm = llm.bound
+    params.update(getattr(llm, "_identifying_params", None) or {})
+    params["base_url"] = getattr(llm, "openai_api_base", None)
+    params["class"] = type(llm).__name__
+    return params
+
+
+def _normalize(message: BaseMessage) -> List[Any]:
+    content = message.content
+    if isinstance(content, str):
+        content = " ".join(content.split())
+    return [message.type, getattr(message, "name", None), content]
+
+
+def _cache_key(llm: Any, messages: List[BaseMessage], kwargs: Dict[str, Any]) -> str:
+    payload = {
+        "model": _model_params(llm),
+        "kwargs": kwargs,
+        "messages": [_normalize(m) for m in messages],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def is_cacheable(llm: Any, node: str) -> bool:
+    return node in LLM_CACHE_NODES and _model_params(llm).get("temperature") in (0, 0.0)
+
+
+async def cached_ainvoke(llm: Any, messages: List[BaseMessage], node: str, **kwargs) -> AIMessage:
+    """
+    `llm.ainvoke(messages, **kwargs)` through the response cache when `node` has it enabled
+    and the model is deterministic; a plain call otherwise.
+    """
+    if not is_cacheable(llm, node):
+        return await llm.ainvoke(messages, **kwargs)
+
+    stats = _node_stats(node)
+    key = _cache_key(llm, messages, kwargs)
+    entry = _memory_cache.get(key)
+    if entry is not None:
+        stats["memory_hits"] += 1
+    elif _disk_cache is not None:
+        try:
+            blob = await asyncio.to_thread(_disk_cache.get, key)
+        except Exception as e:
+            logging.error(f"LLM cache disk read failed: {e}")
+            blob = None
+        if blob is not None:
+            entry = json.loads(blob)
+            _memory_cache.set(key, entry)
+            stats["disk_hits"] += 1
+
+    if entry is not None:
+        stats["saved_ms"] += entry["latency_ms"]
+        return AIMessage(content=entry["content"], response_metadata={"cache_hit": True})
+
+    stats["misses"] += 1
+    start = time.perf_counter()
+    response = await llm.ainvoke(messages, **kwargs)
+    # Tool-call responses carry more than text; only plain answers are cached
+    if isinstance(response.content, str) and not getattr(response, "tool_calls", None):
+        entry = {"content": response.content, "latency_ms": (time.perf_counter() - start) * 1000}
+        _memory_cache.set(key, entry)
+        if _disk_cache is not None:
+            try:
+                await asyncio.to_thread(_disk_cache.set, key, json.dumps(entry).encode("utf-8"))
+            except Exception as e:
+                logging.error(f"LLM cache disk write failed: {e}")
+    return response
+
+
+def clear_llm_cache() -> None:
+    _memory_cache.clear()
+    if _disk_cache is not None:
+        _disk_cache.clear()
+
+
+def get_llm_cache_stats() -> dict:
+    nodes = {}
+    for node, stats in _stats.items():
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        nodes[node] = {**stats, "saved_ms": round(stats["saved_ms"], 1), "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+    return {
+        "enabled_nodes": sorted(LLM_CACHE_NODES),
+        "memory_size": len(_memory_cache),
+        "disk_size": len(_disk_cache) if _disk_cache is not None else 0,
+        "disk_max_rows": LLM_CACHE_DISK_MAX_ROWS if _disk_cache is not None else 0,
+        "nodes": nodes,
+    }
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_openai import ChatOpenAI
+
+# --- Default Model (used when an agent has no model, or its model is unknown) ---
+DEFAULT_BASE_URL = os.getenv("OPENAI_API_BASE", "http://localhost:11434/v1")
+DEFAULT_API_KEY = os.getenv("OPENAI_API_KEY", "ollama")
+DEFAULT_MODEL_NAME = os.getenv("MODEL_NAME", "llama3")
+
+# --- Shared HTTP Pool ---
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+
+# --- Model Configs ---
+# Admin routes invalidate on write; the TTL bounds staleness for writes from other processes
+LLM_REGISTRY_TTL = float(os.getenv("LLM_REGISTRY_TTL", "300"))
+
+# Cached LLM clients, one per distinct endpoint configuration
+ClientKey = Tuple[str, str, Optional[str], Optional[str]]   # (provider, model_id, base_url, api_key)
+_clients: Dict[ClientKey, BaseChatModel] = {}
+# Active ai_models rows by model_id (None until loaded) and when they were loaded
+_model_configs: Optional[Dict[str, dict]] = None
+_loaded_at = 0.0
+# Bumped by every invalidation, so a load that started before one doesn't store its stale rows
+_generation = 0
+_load_lock = asyncio.Lock()
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """One keep-alive pool shared by every client (httpx pools per host internally)."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+        )
+    return _http_client
+
+
+def _build_client(provider: str, model_id: str, base_url: Optional[str], api_key: Optional[str]) -> BaseChatModel:
+    """
+    All providers are reached through OpenAI-compatible endpoints (Ollama serves one under /v1).
+    """
+    provider = provider.upper()
+    if provider == "OLLAMA":
+        base_url = (base_url or "http://localhost:11434").rstrip("/")
+        if not base_url.endswith("/v1"):
+            base_url = f"{base_url}/v1"
+        api_key = api_key or "ollama"
+    elif provider != "OPENAI" and not base_url:
+        raise ValueError(f"Provider {provider} needs an OpenAI-compatible base_url")
+
+    return ChatOpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        model=model_id,
+        temperature=0,
+        http_async_client=_get_http_client(),
+    )
+
+
+def get_client(provider: str, model_id: str, base_url: Optional[str] = None, api_key: Optional[str] = None) -> BaseChatModel:
+    key = (provider.upper(), model_id, base_url, api_key)
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = _build_client(*key)
+    return client
+
+
+def get_default_llm() -> BaseChatModel:
+    return get_client("OPENAI", DEFAULT_MODEL_NAME, DEFAULT_BASE_URL, DEFAULT_API_KEY)
+
+
+def _configs_fresh() -> bool:
+    return _model_configs is not None and time.monotonic() - _loaded_at < LLM_REGISTRY_TTL
+
+
+async def load_model_configs(force: bool = False) -> Dict[str, dict]:
+    """
+    The active ai_models rows by model_id, loaded once and again after an invalidation
+    or LLM_REGISTRY_TTL.
+    """
+    global _model_configs, _loaded_at
+    if _configs_fresh() and not force:
+        return _model_configs
+    async with _load_lock:
+        if _configs_fresh() and not force:
+            return _model_configs
+        generation = _generation
+        from backend.db import get_async_supabase
+        db = await get_async_supabase()
+        response = await db.table("ai_models").select("*").eq("is_active", True).execute()
+        configs = {row["model_id"]: row for row in response.data or []}
+        if generation == _generation:
+            _model_configs, _loaded_at = configs, time.monotonic()
+            logging.info(f"LLM registry: loaded {len(configs)} active model configs")
+        else:
+            logging.info("LLM registry: ai_models changed during load; not caching the loaded configs")
+        return configs
+
+
+async def get_llm(model_id: Optional[str]) -> BaseChatModel:
+    """
+    The client for an agent's `model` (an ai_models.model_id). Falls back to the default
+    model when it is unset, unknown, or its config can't be loaded.
+    """
+    if not model_id:
+        return get_default_llm()
+    try:
+        config = (await load_model_configs()).get(model_id)
+        if config is None:
+            logging.warning(f"LLM registry: unknown model '{model_id}', using default")
+            return get_default_llm()
+        return get_client(config["provider"], config["model_id"], config.get("base_url"), config.get("api_key"))
+    except Exception as e:
+        logging.error(f"LLM registry: failed to resolve model '{model_id}': {e}")
+        return get_default_llm()
+
+
+def invalidate(model_id: Optional[str] = None) -> None:
+    """
+    Drops the loaded ai_models rows (reloaded on next use) and the cached clients of
+    `model_id`, or of every model when None. Called when admin routes change ai_models.
+    """
+    global _model_configs, _generation
+    _model_configs = None
+    _generation += 1
+    for key in list(_clients):
+        if model_id is None or key[1] == model_id:
+            del _clients[key]
+
+
+async def close_llm_clients() -> None:
+    """Closes the shared HTTP pool (called on app shutdown)."""
+    global _http_client
+    _clients.clear()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def get_registry_stats() -> dict:
+    return {
+        "clients": len(_clients),
+        "model_configs": len(_model_configs) if _model_configs is not None else None,
+    }
@@ -1,105 +1,222 @@
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_config, get_stream_writer
 from backend.agents.state import AgentState
+from backend.agents.llm_registry import get_default_llm
+from backend.agents.router import route
+from backend.agents.context import bounded_messages, compact, count_tokens, fit_messages, get_budget, message_tokens, truncate_tool_output
+from backend.agents.tool_calling import (
+    ToolCall, bind_tool_model, extract_tool_calls, format_tool_calls, get_tool_prompt, native_rejected, parse_tool_calls,
+)
 from backend.tools.search import search_tool
 from backend.tools.filesystem import list_directory, read_file, write_file
-import os
+import asyncio
 import json
+import logging
+import os
+import time
+from typing import Any, List, Optional
 
 # --- Model Setup ---
-base_url = os.getenv("OPENAI_API_BASE", "http://localhost:11434/v1")
-api_key = os.getenv("OPENAI_API_KEY", "ollama") 
-model_name = os.getenv("MODEL_NAME", "llama3") 
-
-llm = ChatOpenAI(
-    base_url=base_url,
-    api_key=api_key,
-    model=model_name,
-    temperature=0
-)
+# The agent's client comes from the LLM registry via config["configurable"]["llm"]
+# (set in chat_stream); runs without one use the default model.
+def get_node_llm(config: Optional[RunnableConfig]):
+    return ((config or {}).get("configurable") or {}).get("llm") or get_default_llm()
 
-# --- Supervisor Node (Router) ---
-def supervisor_node(state: AgentState):
-    messages = state['messages']
-    options = ["Researcher", "Developer", "Reviewer", "FINISH"]
-    
-    prompt = (
-        "You are a supervisor managing: Researcher, Developer, Reviewer.\n"
-        "Your goal is to route the conversation to the right worker or FINISH.\n"
-        "Researcher: Searches for information.\n"
-        "Developer: Writes code or files.\n"
-        "Reviewer: Reviews code/files.\n\n"
-        "Based on the conversation below, who should act next?\n"
-        f"Select one of: {', '.join(options)}\n"
-        "Respond ONLY with the role name."
-    )
-    
-    response = llm.invoke([SystemMessage(content=prompt)] + messages)
-    next_agent = response.content.strip().replace("'", "").replace('"', "")
-    
-    if next_agent not in options:
-        lower = next_agent.lower()
-        if "research" in lower: next_agent = "Researcher"
-        elif "develop" in lower or "code" in lower: next_agent = "Developer"
-        elif "review" in lower: next_agent = "Reviewer"
-        else: next_agent = "FINISH"
+# --- Context Budget ---
+# Nodes send a bounded view of the history (rolling summary + recent messages), see context.py
+def build_prompt(prompt: str, state: AgentState, llm, reserve_tokens: int = 0):
+    return [SystemMessage(content=prompt)] + bounded_messages(state, llm, count_tokens(prompt) + reserve_tokens)
 
+async def compact_node(state: AgentState, config: RunnableConfig):
+    """Refreshes the rolling summary (stored in the checkpoint) when the history outgrows the budget."""
+    return await compact(state, get_node_llm(config))
+
+# --- Supervisor Node (Router) ---
+async def supervisor_node(state: AgentState, config: RunnableConfig):
+    # Strategy chain (rules / embedding / constrained llm / full prompt) is configured in router.py
+    llm = get_node_llm(config)
+    next_agent = await route(bounded_messages(state, llm), llm)
     return {"next": next_agent}
 
+# --- Stream Events ---
+def emit_event(event: dict):
+    """
+    Sends a custom event (tool calls etc.) to `stream_mode="custom"` consumers, tagged with the node.
+    No-op when called outside a graph run.
+    """
+    try:
+        writer = get_stream_writer()
+        node = get_config().get("metadata", {}).get("langgraph_node")
+    except RuntimeError:
+        return
+    writer({"node": node, **event})
+
 # --- Tool Execution Helper ---
-def run_tool_from_response(response_content: str, available_tools: dict):
-    if "TOOL_CALL:" in response_content:
+# A response may contain several TOOL_CALL lines. They run concurrently (bounded), each
+# with its own timeout, and results come back in call order. Calls to tools with side
+# effects (TOOLS_SEQUENTIAL) make the whole batch run one at a time, in order.
+# A timeout only stops waiting: a sync tool keeps running on its executor thread. So
+# TOOLS_SEQUENTIAL tools get no timeout (the next call must not start while a write is
+# still running), and timed-out results say the call may still complete.
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "4"))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "30"))
+# Per-tool overrides, e.g. '{"search_tool": 20}'
+TOOL_TIMEOUTS = json.loads(os.getenv("TOOL_TIMEOUTS", "{}"))
+TOOLS_SEQUENTIAL = {"write_file"}
+
+async def run_tool_call(index: int, tool_name: str, args: Any, available_tools: dict, semaphore: asyncio.Semaphore) -> str:
+    if isinstance(args, str):
+        return args
+    tool_func = available_tools.get(tool_name)
+    if not tool_func:
+        return f"Error: Tool {tool_name} not found."
+    timeout = None if tool_name in TOOLS_SEQUENTIAL else TOOL_TIMEOUTS.get(tool_name, TOOL_TIMEOUT)
+    async with semaphore:
         try:
-            parts = response_content.split("TOOL_CALL:", 1)[1].strip()
-            tool_name, args_str = parts.split(" ", 1)
-            tool_name = tool_name.strip()
-            args = json.loads(args_str)
-            
-            tool_func = available_tools.get(tool_name)
-            if tool_func:
-                print(f"--- Executing {tool_name} with {args} ---")
-                return tool_func.invoke(args)
-            else:
-                return f"Error: Tool {tool_name} not found."
+            print(f"--- Executing {tool_name} with {args} ---")
+            emit_event({"type": "tool_call", "call": index, "tool": tool_name, "args": args})
+            # Sync tools are run in the default executor, so file/network I/O doesn't block the loop
+            result = await asyncio.wait_for(tool_func.ainvoke(args), timeout=timeout)
+        except asyncio.TimeoutError:
+            result = f"Error: {tool_name} timed out after {timeout:g}s (it may still complete in the background)"
         except Exception as e:
-            return f"Error executing tool: {e}"
-    return None
+            result = f"Error executing tool: {e}"
+    emit_event({"type": "tool_result", "call": index, "tool": tool_name, "preview": str(result)[:200]})
+    return result
+
+async def run_tool_calls(calls: List[ToolCall], available_tools: dict) -> List[str]:
+    """Runs the calls (concurrently unless one is sequential) and returns their results in call order."""
+    sequential = any(name in TOOLS_SEQUENTIAL for name, _ in calls)
+    semaphore = asyncio.Semaphore(1 if sequential else TOOL_MAX_CONCURRENCY)
+    # gather keeps call order; with a semaphore of 1 the calls also start in order
+    return await asyncio.gather(*[
+        run_tool_call(i, name, args, available_tools, semaphore) for i, (name, args) in enumerate(calls)
+    ])
+
+def format_tool_results(calls: List[ToolCall], results: List[str]) -> str:
+    """The result itself for a single call, or one attributed section per call (in call order)."""
+    if len(calls) == 1:
+        return results[0]
+    return "\n\n".join(
+        f"({i + 1}) {name} {json.dumps(args) if not isinstance(args, str) else ''}\n{result}".rstrip()
+        for i, ((name, args), result) in enumerate(zip(calls, results))
+    )
+
+async def run_tool_from_response(response_content: str, available_tools: dict):
+    """
+    Runs every text-protocol tool call in the response. Returns None if there are none,
+    otherwise the formatted results.
+    """
+    calls = parse_tool_calls(response_content)
+    if not calls:
+        return None
+    return format_tool_results(calls, await run_tool_calls(calls, available_tools))
 
 # --- Worker Nodes (Manual ReAct) ---
+# Nodes are async: run the graph with `astream`/`ainvoke` so LLM calls don't block the event loop.
+# Workers loop inside the node (LLM -> tool -> result -> LLM ...) until they answer without a
+# tool call or hit a limit, and only then report back to the supervisor.
+WORKER_MAX_STEPS = int(os.getenv("WORKER_MAX_STEPS", "5"))          # LLM calls per worker turn
+WORKER_MAX_SECONDS = float(os.getenv("WORKER_MAX_SECONDS", "120"))  # no new step starts after this
 
-def get_react_prompt(role: str, tools_desc: str):
+def get_react_prompt(role: str, tools_desc: str, mode: str = "text"):
     return (
         f"You are the {role}.\n"
         f"You have access to these tools:\n{tools_desc}\n\n"
-        "To use a tool, your LAST line must be exactly:\n"
-        "TOOL_CALL: ToolName {\"arg\": \"value\"}\n\n"
-        "Examples:\n"
-        "TOOL_CALL: search_tool {\"query\": \"LangGraph\"}\n"
-        "TOOL_CALL: write_file {\"path\": \"hello.txt\", \"content\": \"Hello\"}\n\n"
+        f"{get_tool_prompt(mode)}\n"
         "If you have completed your task or don't need tools, just respond with your report/answer."
     )
 
-def researcher_node(state: AgentState):
+def step_messages(mode: str, response: AIMessage, calls: List[ToolCall], results: List[str]) -> list:
+    """
+    The messages a tool step adds to the worker's context. Native calls are answered with one
+    ToolMessage per call id (the provider requires it); the other modes with a `[Tool Result]:` message.
+    """
+    if mode == "native" and response.tool_calls and len(response.tool_calls) == len(calls):
+        return [response] + [
+            ToolMessage(content=f"[Tool Result]: {result}", tool_call_id=call["id"])
+            for call, result in zip(response.tool_calls, results)
+        ]
+    return [AIMessage(content=response.content), HumanMessage(content=f"[Tool Result]: {format_tool_results(calls, results)}")]
+
+def as_text_step(messages: list) -> list:
+    """A native step rewritten for the text protocol (tool calls as TOOL_CALL lines, results as user messages)."""
+    converted = []
+    for m in messages:
+        if isinstance(m, ToolMessage):
+            converted.append(HumanMessage(content=m.content))
+        elif getattr(m, "tool_calls", None):
+            calls = format_tool_calls([(c["name"], c["args"]) for c in m.tool_calls])
+            converted.append(AIMessage(content=f"{m.content}\n{calls}".strip()))
+        else:
+            converted.append(m)
+    return converted
+
+async def run_react_loop(role: str, tools_desc: str, tools_map: dict, state: AgentState, config: RunnableConfig) -> AIMessage:
+    """
+    Bounded in-node tool loop. Returns one message for the graph state: the final answer
+    first, then every step with its tool result (old tool output is truncated from the first
+    `[Tool Result]:` on, so the answer must come before it).
+    """
+    llm = get_node_llm(config)
+    mode, model = bind_tool_model(llm, list(tools_map.values()))
+    steps = []         # messages added by each tool step of this turn
+    report = []        # text of each tool step for the returned message
+    answer = None
+    started = time.monotonic()
+
+    step = 0
+    while step < WORKER_MAX_STEPS:
+        prompt = get_react_prompt(role, tools_desc, mode)
+        # Earlier steps' tool output is truncated like old history. The history makes room for
+        # this turn's steps at that truncated size, and the latest step's results get the rest
+        # of the budget (whole if they fit)
+        earlier = [truncate_tool_output(m) for s in steps[:-1] for m in s]
+        latest = steps[-1] if steps else []
+        reserve = sum(message_tokens(m) for m in earlier + [truncate_tool_output(m) for m in latest])
+        messages = build_prompt(prompt, state, llm, reserve)
+        room = get_budget(llm) - sum(message_tokens(m) for m in messages + earlier)
+        context = earlier + fit_messages(latest, room)
+        try:
+            response = await model.ainvoke(messages + context)
+        except Exception as e:
+            # Endpoint refused native tools: continue this turn with the text protocol
+            if mode != "native" or not native_rejected(llm, e):
+                raise
+            mode, model = "text", llm
+            steps = [as_text_step(s) for s in steps]
+            continue
+        step += 1
+
+        content, calls = extract_tool_calls(response, mode)
+        if not calls:
+            answer = content
+            break
+        results = await run_tool_calls(calls, tools_map)
+        tool_text = content if mode == "text" else "\n".join(filter(None, [content, format_tool_calls(calls)]))
+        report.append(f"{tool_text}\n\n[Tool Result]: {format_tool_results(calls, results)}")
+        steps.append(step_messages(mode, response, calls, results))
+
+        if time.monotonic() - started > WORKER_MAX_SECONDS:
+            logging.warning(f"{role}: time limit ({WORKER_MAX_SECONDS:g}s) reached after {step} steps")
+            break
+    else:
+        logging.warning(f"{role}: step limit ({WORKER_MAX_STEPS}) reached")
+
+    if answer is None:
+        answer = f"(Stopped after {len(report)} tool steps without a final answer.)"
+    return AIMessage(content="\n\n".join([answer] + report), name=role)
+
+async def researcher_node(state: AgentState, config: RunnableConfig):
     tools_map = {"search_tool": search_tool}
     tools_desc = "- search_tool(query): Web search."
     
-    prompt = get_react_prompt("Researcher", tools_desc)
-    messages = [SystemMessage(content=prompt)] + state['messages']
-    
-    response = llm.invoke(messages)
-    content = response.content
-    
-    tool_result = run_tool_from_response(content, tools_map)
-    if tool_result:
-        summary = f"{content}\n\n[Tool Result]: {tool_result}"
-    else:
-        summary = content
-        
     return {
-        "messages": [AIMessage(content=summary, name="Researcher")]
+        "messages": [await run_react_loop("Researcher", tools_desc, tools_map, state, config)]
     }
 
-def developer_node(state: AgentState):
+async def developer_node(state: AgentState, config: RunnableConfig):
     tools_map = {
         "list_directory": list_directory,
         "read_file": read_file,
@@ -111,26 +228,15 @@ def developer_node(state: AgentState):
         "- write_file(path, content): Write file content."
     )
     
-    prompt = get_react_prompt("Developer", tools_desc)
-    messages = [SystemMessage(content=prompt)] + state['messages']
-    
-    response = llm.invoke(messages)
-    content = response.content
-    
-    tool_result = run_tool_from_response(content, tools_map)
-    if tool_result:
-        summary = f"{content}\n\n[Tool Result]: {tool_result}"
-    else:
-        summary = content
-        
     return {
-        "messages": [AIMessage(content=summary, name="Developer")]
+        "messages": [await run_react_loop("Developer", tools_desc, tools_map, state, config)]
     }
 
-def reviewer_node(state: AgentState):
-    prompt = "You are a Reviewer. Review the previous work. If acceptable, say 'Approved'."
-    messages = [SystemMessage(content=prompt)] + state['messages']
-    response = llm.invoke(messages)
+async def reviewer_node(state: AgentState, config: RunnableConfig):
+    prompt = "You are a Reviewer. Review the previous work. If acceptable, start your reply with 'Approved'; otherwise list the changes needed."
+    llm = get_node_llm(config)
+    messages = build_prompt(prompt, state, llm)
+    response = await llm.ainvoke(messages)
     return {
         "messages": [AIMessage(content=response.content, name="Reviewer")]
     }
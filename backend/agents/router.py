@@ -0,0 +1,199 @@
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from backend.agents.llm_cache import cached_ainvoke
+from backend.embeddings import aget_embeddings
+
+# --- Supervisor Routing ---
+# SUPERVISOR_ROUTER is an ordered, comma-separated list of strategies. Each one either
+# decides the next node or passes (None) to the next; "full" always decides.
+#   rules:     deterministic shortcuts (Reviewer approved -> FINISH, hop limit)
+#   embedding: similarity of the user's request to per-role descriptions (turn start only)
+#   llm:       constrained generation over the recent messages, tiny token budget + stop sequence
+#   full:      the original prompt over the whole history
+SUPERVISOR_ROUTER = [s.strip() for s in os.getenv("SUPERVISOR_ROUTER", "rules,llm,full").split(",") if s.strip()]
+ROUTER_MAX_HOPS = int(os.getenv("ROUTER_MAX_HOPS", "8"))                  # worker turns per user message
+ROUTER_HISTORY_MESSAGES = int(os.getenv("ROUTER_HISTORY_MESSAGES", "6"))  # messages the llm router sees
+ROUTER_MAX_TOKENS = int(os.getenv("ROUTER_MAX_TOKENS", "8"))
+ROUTER_MIN_SIMILARITY = float(os.getenv("ROUTER_MIN_SIMILARITY", "0.35"))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.05"))        # best vs. runner-up
+
+WORKERS = ["Researcher", "Developer", "Reviewer"]
+OPTIONS = WORKERS + ["FINISH"]
+
+ROLE_DESCRIPTIONS = {
+    "Researcher": "Search the web, look up documentation, find information, compare options, explain concepts.",
+    "Developer": "Write or change code, create or edit files, list directories, implement a feature, fix a bug.",
+    "Reviewer": "Review code or files, check the work for mistakes, approve or request changes.",
+}
+
+# Per-strategy counters: calls, decisions made, errors, total latency
+_stats: Dict[str, Dict[str, float]] = {}
+# Turns that fell back to FINISH because every strategy raised
+_all_failed = 0
+_role_vectors: Optional[np.ndarray] = None
+
+# A sentence that opens with the verdict ("Approved.", "Verdict: **Approved**"), so
+# "Not approved" / "cannot be approved yet" / "unapproved" don't end the run
+_APPROVAL = re.compile(r"^\W*(?:(?:verdict|status|decision)\W*)?approved\b", re.IGNORECASE)
+
+
+def _record(strategy: str, started: float, decided: bool, error: bool = False) -> None:
+    stats = _stats.setdefault(strategy, {"calls": 0, "decided": 0, "errors": 0, "total_ms": 0.0})
+    stats["calls"] += 1
+    stats["decided"] += int(decided)
+    stats["errors"] += int(error)
+    stats["total_ms"] += (time.perf_counter() - started) * 1000
+
+
+def is_approval(text: str) -> bool:
+    """True if any sentence or line of the Reviewer's reply starts with an explicit `Approved`."""
+    return any(_APPROVAL.match(sentence) for sentence in re.split(r"[.!?\n]+", text))
+
+
+def parse_route(text: str) -> Optional[str]:
+    """Maps model output to an option: exact name first, then keywords. None if nothing fits."""
+    cleaned = text.strip().replace("'", "").replace('"', "").rstrip(".")
+    if cleaned in OPTIONS:
+        return cleaned
+    lower = cleaned.lower()
+    if "research" in lower: return "Researcher"
+    if "develop" in lower or "code" in lower: return "Developer"
+    if "review" in lower: return "Reviewer"
+    if "finish" in lower: return "FINISH"
+    return None
+
+
+def _turn_messages(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """Messages after the latest user message (the work done in this turn so far)."""
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return messages[i + 1:]
+    return messages
+
+
+# --- Strategies ---
+
+async def route_rules(messages: List[BaseMessage], llm: Any) -> Optional[str]:
+    if not messages:
+        return "FINISH"
+    last = messages[-1]
+    if getattr(last, "name", None) == "Reviewer" and is_approval(str(last.content)):
+        return "FINISH"
+    worker_turns = sum(1 for m in _turn_messages(messages) if getattr(m, "name", None) in WORKERS)
+    if worker_turns >= ROUTER_MAX_HOPS:
+        logging.warning(f"Router: {worker_turns} worker turns without finishing; stopping.")
+        return "FINISH"
+    return None
+
+
+async def route_embedding(messages: List[BaseMessage], llm: Any) -> Optional[str]:
+    """
+    Only routes the first hop of a turn (the last message is the user's); what comes after
+    a worker's report depends on the report, which role descriptions don't capture.
+    """
+    global _role_vectors
+    if not messages or not isinstance(messages[-1], HumanMessage):
+        return None
+    if _role_vectors is None:
+        vectors = await aget_embeddings([ROLE_DESCRIPTIONS[w] for w in WORKERS])
+        if any(v is None for v in vectors):
+            return None
+        matrix = np.asarray(vectors, dtype=np.float32)
+        _role_vectors = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    query = (await aget_embeddings([str(messages[-1].content)]))[0]
+    if query is None:
+        return None
+    query = np.asarray(query, dtype=np.float32)
+    similarities = _role_vectors @ (query / np.linalg.norm(query))
+    best, runner_up = np.argsort(-similarities)[:2]
+    if similarities[best] < ROUTER_MIN_SIMILARITY or similarities[best] - similarities[runner_up] < ROUTER_MIN_MARGIN:
+        return None
+    return WORKERS[best]
+
+
+async def route_llm(messages: List[BaseMessage], llm: Any) -> Optional[str]:
+    prompt = (
+        "Route the conversation. Researcher: finds information. Developer: writes code/files. "
+        "Reviewer: reviews work. FINISH: the request is answered.\n"
+        f"Reply with exactly one word: {', '.join(OPTIONS)}."
+    )
+    recent = messages[-ROUTER_HISTORY_MESSAGES:]
+    response = await cached_ainvoke(
+        llm, [SystemMessage(content=prompt)] + recent, "supervisor",
+        stop=["\n"], max_tokens=ROUTER_MAX_TOKENS,
+    )
+    return parse_route(response.content)
+
+
+async def route_full(messages: List[BaseMessage], llm: Any) -> Optional[str]:
+    prompt = (
+        "You are a supervisor managing: Researcher, Developer, Reviewer.\n"
+        "Your goal is to route the conversation to the right worker or FINISH.\n"
+        "Researcher: Searches for information.\n"
+        "Developer: Writes code or files.\n"
+        "Reviewer: Reviews code/files.\n\n"
+        "Based on the conversation below, who should act next?\n"
+        f"Select one of: {', '.join(OPTIONS)}\n"
+        "Respond ONLY with the role name."
+    )
+    # Same conversation prefix -> same route at temperature 0, so routing goes through the response cache
+    response = await cached_ainvoke(llm, [SystemMessage(content=prompt)] + messages, "supervisor")
+    return parse_route(response.content) or "FINISH"
+
+
+STRATEGIES = {
+    "rules": route_rules,
+    "embedding": route_embedding,
+    "llm": route_llm,
+    "full": route_full,
+}
+
+
+async def route(messages: List[BaseMessage], llm: Any, strategies: Optional[List[str]] = None) -> str:
+    """Runs the configured strategies in order; the first decision wins (FINISH if none decide)."""
+    global _all_failed
+    attempted = failed = 0
+    for name in strategies or SUPERVISOR_ROUTER:
+        strategy = STRATEGIES.get(name)
+        if strategy is None:
+            logging.error(f"Router: unknown strategy '{name}'")
+            continue
+        attempted += 1
+        started = time.perf_counter()
+        try:
+            decision = await strategy(messages, llm)
+            error = False
+        except Exception as e:
+            logging.error(f"Router strategy '{name}' failed: {e}")
+            decision, error = None, True
+            failed += 1
+        _record(name, started, decision is not None, error)
+        if decision is not None:
+            logging.info(f"Router: '{name}' -> {decision}")
+            return decision
+    if attempted and failed == attempted:
+        # e.g. the LLM endpoint is down: the turn ends, but not because the task is done
+        _all_failed += 1
+        logging.warning("Router: every strategy failed; ending the turn with FINISH")
+    return "FINISH"
+
+
+def get_router_stats() -> dict:
+    return {
+        "strategies": SUPERVISOR_ROUTER,
+        "all_failed": _all_failed,
+        "stats": {
+            name: {
+                **stats,
+                "total_ms": round(stats["total_ms"], 1),
+                "avg_ms": round(stats["total_ms"] / stats["calls"], 1) if stats["calls"] else 0.0,
+            }
+            for name, stats in _stats.items()
+        },
+    }
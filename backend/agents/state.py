@@ -2,6 +2,9 @@ from typing import TypedDict, Annotated, List
 from langchain_core.messages import BaseMessage
 import operator
 
-class AgentState(TypedDict):
+class AgentState(TypedDict, total=False):
     messages: Annotated[List[BaseMessage], operator.add]
     next: str
+    # Rolling summary of messages[:summary_upto], maintained by the compact node
+    summary: str
+    summary_upto: int
@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+import openai
+from langchain_core.messages import AIMessage
+
+# --- Tool Calling Modes ---
+# How workers ask for tools (TOOL_CALLING_MODE):
+#   native: the provider's tool-call schema via bind_tools (OpenAI, and Ollama models with tool support)
+#   json:   JSON-mode output ({"tool_calls": [...]} or {"answer": ...}) for models without tool support
+#   text:   the `TOOL_CALL: name {json}` text protocol
+# native falls back to text when the model can't bind tools or the endpoint rejects them (remembered
+# per model); json falls back to the text parser for a response that isn't valid JSON.
+TOOL_CALLING_MODE = os.getenv("TOOL_CALLING_MODE", "native")
+MODES = ("native", "json", "text")
+
+ToolCall = Tuple[str, Any]   # (tool name, args dict, or an error string if the call couldn't be parsed)
+
+_TOOL_CALL_PATTERN = re.compile(r"TOOL_CALL:\s*([A-Za-z_][\w]*)\s*")
+
+# Models whose endpoint rejected native tool calls
+_native_unsupported = set()
+# Per-mode counters: responses, tool calls (parsed or not), calls that couldn't be parsed,
+# responses with any parse failure (each one costs the worker a step), fallbacks to text
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _record(mode: str, calls: List[ToolCall] = (), responses: int = 1, fallbacks: int = 0, invalid: bool = False) -> None:
+    stats = _stats.setdefault(mode, {"responses": 0, "tool_calls": 0, "parse_failures": 0, "failed_responses": 0, "fallbacks": 0})
+    failures = sum(1 for _, args in calls if isinstance(args, str))
+    stats["responses"] += responses
+    stats["tool_calls"] += len(calls)
+    stats["parse_failures"] += failures
+    stats["failed_responses"] += int(bool(failures) or invalid)
+    stats["fallbacks"] += fallbacks
+
+
+def _model_name(llm: Any) -> Optional[str]:
+    return getattr(llm, "model_name", None)
+
+
+def parse_tool_calls(response_content: str) -> List[ToolCall]:
+    """
+    All `TOOL_CALL: name {json}` occurrences, in order. The JSON may span lines.
+    Unparseable arguments are kept as an error string in place of the args.
+    """
+    calls = []
+    decoder = json.JSONDecoder()
+    for match in _TOOL_CALL_PATTERN.finditer(response_content):
+        try:
+            args, _ = decoder.raw_decode(response_content, match.end())
+        except ValueError as e:
+            args = f"Error: invalid arguments ({e})"
+        calls.append((match.group(1), args))
+    return calls
+
+
+def format_tool_calls(calls: List[ToolCall]) -> str:
+    """Text-protocol rendering of calls, so worker reports read the same in every mode."""
+    return "\n".join(f"TOOL_CALL: {name} {json.dumps(args) if isinstance(args, dict) else '{}'}" for name, args in calls)
+
+
+def bind_tool_model(llm: Any, tools: List[Any], mode: Optional[str] = None) -> Tuple[str, Any]:
+    """(effective mode, model to call). Models that can't bind tools get the text protocol."""
+    mode = mode or TOOL_CALLING_MODE
+    if mode not in MODES:
+        logging.error(f"Unknown TOOL_CALLING_MODE '{mode}', using text")
+        mode = "text"
+    if mode == "native":
+        if _model_name(llm) in _native_unsupported:
+            return "text", llm
+        try:
+            return "native", llm.bind_tools(tools)
+        except Exception as e:
+            # e.g. NotImplementedError for models without tool support in LangChain
+            logging.info(f"Tool calling: bind_tools unavailable for {type(llm).__name__} ({e}); using text")
+            _record("native", responses=0, fallbacks=1)
+            return "text", llm
+    if mode == "json":
+        return "json", llm.bind(response_format={"type": "json_object"})
+    return "text", llm
+
+
+def native_rejected(llm: Any, error: Exception) -> bool:
+    """
+    True if `error` is the endpoint refusing tools (e.g. an Ollama model without tool support).
+    The model then uses the text protocol from now on.
+    """
+    if not isinstance(error, openai.BadRequestError) or "tool" not in str(error).lower():
+        return False
+    logging.warning(f"Tool calling: native tools rejected for {_model_name(llm)} ({error}); using text")
+    if _model_name(llm):
+        _native_unsupported.add(_model_name(llm))
+    _record("native", responses=0, fallbacks=1)
+    return True
+
+
+def extract_tool_calls(response: AIMessage, mode: str) -> Tuple[str, List[ToolCall]]:
+    """
+    (text of the response, tool calls) for a response in the given mode. No calls means the
+    text is the worker's answer.
+    """
+    content = response.content if isinstance(response.content, str) else str(response.content)
+    if mode == "native":
+        calls: List[ToolCall] = [(c["name"], c["args"]) for c in response.tool_calls]
+        calls += [
+            (c.get("name") or "unknown", f"Error: invalid arguments ({c.get('error') or c.get('args')})")
+            for c in getattr(response, "invalid_tool_calls", None) or []
+        ]
+        # Some models still write the text protocol despite having tools bound
+        if not calls:
+            calls = parse_tool_calls(content)
+        _record("native", calls)
+        return content, calls
+
+    if mode == "json":
+        try:
+            data = json.loads(content)
+            if not isinstance(data, dict):
+                raise ValueError("not a JSON object")
+        except ValueError:
+            calls = parse_tool_calls(content)
+            _record("json", calls, fallbacks=1, invalid=True)
+            return content, calls
+        calls = []
+        for item in data.get("tool_calls") or []:
+            if isinstance(item, dict) and isinstance(item.get("name"), str) and isinstance(item.get("args", {}), dict):
+                calls.append((item["name"], item.get("args", {})))
+            else:
+                calls.append((str(item.get("name") if isinstance(item, dict) else "unknown"), f"Error: invalid tool call {json.dumps(item)}"))
+        _record("json", calls)
+        answer = data.get("answer")
+        return (answer if isinstance(answer, str) else "" if calls else content), calls
+
+    calls = parse_tool_calls(content)
+    _record("text", calls)
+    return content, calls
+
+
+def get_tool_prompt(mode: str) -> str:
+    """Instructions for requesting tools, appended to the worker prompt."""
+    if mode == "native":
+        return (
+            "Call the tools you need; independent calls (e.g. reading several files) can be made together.\n"
+            "You will get each tool's result and can then call another tool."
+        )
+    if mode == "json":
+        return (
+            "Always reply with a single JSON object.\n"
+            "To use tools: {\"tool_calls\": [{\"name\": \"ToolName\", \"args\": {\"arg\": \"value\"}}]}\n"
+            "Independent calls (e.g. reading several files) can be listed together.\n"
+            "When you are done: {\"answer\": \"your report\"}\n"
+            "You will get each tool's result and can then call another tool."
+        )
+    return (
+        "To use a tool, end your response with one line per call, exactly:\n"
+        "TOOL_CALL: ToolName {\"arg\": \"value\"}\n"
+        "Independent calls (e.g. reading several files) can be made together.\n\n"
+        "Examples:\n"
+        "TOOL_CALL: search_tool {\"query\": \"LangGraph\"}\n"
+        "TOOL_CALL: write_file {\"path\": \"hello.txt\", \"content\": \"Hello\"}\n\n"
+        "You will get each tool's result and can then call another tool."
+    )
+
+
+def get_tool_calling_stats() -> dict:
+    return {
+        "mode": TOOL_CALLING_MODE,
+        "native_unsupported_models": sorted(_native_unsupported),
+        "stats": {
+            mode: {
+                **stats,
+                "parse_failure_rate": round(stats["failed_responses"] / stats["responses"], 4) if stats["responses"] else 0.0,
+            }
+            for mode, stats in _stats.items()
+        },
+    }
@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+# Ensure backend directory is in path when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supabase import AsyncClient
+from backend.embeddings import aget_embeddings, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE
+
+# --- Backfill Configuration ---
+# Re-embeds rows with a null embedding or one made by another model: chat_messages
+# (metadata.embedding_model != EMBEDDING_MODEL), then chat_message_chunks (embedding_model
+# column). Writes go through the bulk update RPCs in backfill.sql.
+BACKFILL_PAGE_SIZE = int(os.getenv("BACKFILL_PAGE_SIZE", "200"))
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "2"))        # embedding batches in flight
+BACKFILL_MAX_ROWS_PER_SECOND = float(os.getenv("BACKFILL_MAX_ROWS_PER_SECOND", "20"))  # 0 = unthrottled
+BACKFILL_CHECKPOINT_PATH = os.getenv("BACKFILL_CHECKPOINT_PATH", "backend/.cache/backfill_checkpoint.json")
+
+# Scanned in this order: table -> (filter on the model tag, bulk update RPC)
+TABLES = {
+    "chat_messages": (
+        'embedding.is.null,metadata->>embedding_model.is.null,metadata->>embedding_model.neq."{model}"',
+        "bulk_update_chat_message_embeddings",
+    ),
+    "chat_message_chunks": (
+        'embedding.is.null,embedding_model.is.null,embedding_model.neq."{model}"',
+        "bulk_update_chat_message_chunk_embeddings",
+    ),
+}
+
+_job: Optional[asyncio.Task] = None
+_status: Dict[str, Any] = {"state": "idle"}
+
+
+def _new_checkpoint(model: str) -> Dict[str, Any]:
+    return {"model": model, "last_ids": {table: None for table in TABLES}, "processed": 0, "updated": 0, "failed": 0}
+
+
+def _load_checkpoint(path: str, model: str) -> Dict[str, Any]:
+    """A checkpoint only applies to the model it was written for."""
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("model") == model:
+            # Checkpoints from before chunks were backfilled only tracked chat_messages
+            if "last_ids" not in checkpoint:
+                checkpoint["last_ids"] = {**_new_checkpoint(model)["last_ids"], "chat_messages": checkpoint.pop("last_id", None)}
+            return checkpoint
+    except (OSError, ValueError):
+        pass
+    return _new_checkpoint(model)
+
+
+def _save_checkpoint(path: str, checkpoint: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)   # atomic, so a crash never leaves a half-written checkpoint
+
+
+async def _fetch_page(db: AsyncClient, table: str, model: str, last_id: Optional[str], page_size: int) -> List[Dict[str, Any]]:
+    """Next page of rows needing (re)embedding, keyset-paginated on id."""
+    query = (
+        db.table(table)
+        .select("id, agent_id, content")
+        .or_(TABLES[table][0].format(model=model))
+        .order("id")
+        .limit(page_size)
+    )
+    if last_id is not None:
+        query = query.gt("id", last_id)
+    return (await query.execute()).data or []
+
+
+async def _embed_and_update(db: AsyncClient, table: str, rows: List[Dict[str, Any]], model: str) -> int:
+    vectors = await aget_embeddings([row["content"] for row in rows], model)
+    updates = [{"id": row["id"], "embedding": vector} for row, vector in zip(rows, vectors) if vector is not None]
+    if updates:
+        await db.rpc(TABLES[table][1], {"updates": updates, "embedding_model": model}).execute()
+    return len(updates)
+
+
+async def run_backfill(
+    db: AsyncClient,
+    model: str = EMBEDDING_MODEL,
+    checkpoint_path: str = BACKFILL_CHECKPOINT_PATH,
+    max_rows_per_second: float = BACKFILL_MAX_ROWS_PER_SECOND,
+    max_rows: Optional[int] = None,
+    restart: bool = False,
+) -> Dict[str, Any]:
+    """
+    Scans rows needing (re)embedding (messages, then chunks) and updates them in bulk, page by page.
+    Progress is checkpointed after every page, so an interrupted run resumes where it stopped.
+    Rows that fail to embed are skipped (counted as failed); run with restart=True to retry them.
+    """
+    checkpoint = _load_checkpoint(checkpoint_path, model)
+    if restart:
+        checkpoint = _new_checkpoint(model)
+    _status.update({"state": "running", **checkpoint})
+    started = time.monotonic()
+    processed_this_run = 0
+    touched_agents = set()
+    tables = iter(TABLES)
+    table = next(tables)
+
+    while max_rows is None or processed_this_run < max_rows:
+        page_start = time.monotonic()
+        rows = await _fetch_page(db, table, model, checkpoint["last_ids"].get(table), BACKFILL_PAGE_SIZE)
+        if not rows:
+            table = next(tables, None)
+            if table is None:
+                break
+            continue
+
+        # Concurrent embedding batches, bounded by BACKFILL_CONCURRENCY
+        semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+        async def process(batch):
+            async with semaphore:
+                return await _embed_and_update(db, table, batch, model)
+
+        batches = [rows[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(rows), EMBEDDING_BATCH_SIZE)]
+        updated = sum(await asyncio.gather(*[process(batch) for batch in batches]))
+
+        checkpoint["last_ids"][table] = rows[-1]["id"]
+        checkpoint["processed"] += len(rows)
+        checkpoint["updated"] += updated
+        checkpoint["failed"] += len(rows) - updated
+        _save_checkpoint(checkpoint_path, checkpoint)
+        _status.update(checkpoint)
+        processed_this_run += len(rows)
+        touched_agents.update(row["agent_id"] for row in rows)
+        logging.info(f"Backfill ({table}): {checkpoint['processed']} rows processed, {checkpoint['updated']} updated")
+
+        # Throttle: never exceed max_rows_per_second on average, so live traffic keeps the embedding server
+        if max_rows_per_second > 0:
+            min_duration = len(rows) / max_rows_per_second
+            elapsed = time.monotonic() - page_start
+            if elapsed < min_duration:
+                await asyncio.sleep(min_duration - elapsed)
+
+    _status.update({"state": "done", "seconds": round(time.monotonic() - started, 1)})
+    return {**checkpoint, "agents": sorted(touched_agents)}
+
+
+def start_backfill_job(db: AsyncClient, **kwargs) -> bool:
+    """Runs the backfill in the background of the server process. Returns False if one is already running."""
+    global _job
+    if _job is not None and not _job.done():
+        return False
+
+    async def job():
+        # Imported here: the in-process index only matters when running inside the server
+        from backend.vector_index import vector_index
+        try:
+            result = await run_backfill(db, **kwargs)
+            for agent_id in result["agents"]:
+                vector_index.invalidate(agent_id)
+        except Exception as e:
+            _status.update({"state": "failed", "error": str(e)})
+            logging.error(f"Backfill job failed: {e}")
+
+    _status.clear()
+    _status["state"] = "starting"
+    _job = asyncio.create_task(job())
+    return True
+
+
+def get_backfill_status() -> dict:
+    return dict(_status)
+
+
+async def main(args: argparse.Namespace) -> None:
+    from backend.db import get_async_supabase, close_async_supabase
+    from backend.embeddings import close_embedding_clients
+    db = await get_async_supabase()
+    try:
+        result = await run_backfill(
+            db,
+            model=args.model,
+            checkpoint_path=args.checkpoint,
+            max_rows_per_second=args.rate,
+            max_rows=args.limit,
+            restart=args.restart,
+        )
+        print(f"Backfill finished: {result['processed']} processed, {result['updated']} updated, {result['failed']} failed.")
+    finally:
+        await close_embedding_clients()
+        await close_async_supabase()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Embed chat_messages and chat_message_chunks rows with missing or stale embeddings.")
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="Embedding model to (re)embed with")
+    parser.add_argument("--checkpoint", default=BACKFILL_CHECKPOINT_PATH, help="Checkpoint file for resuming")
+    parser.add_argument("--rate", type=float, default=BACKFILL_MAX_ROWS_PER_SECOND, help="Max rows per second (0 = unthrottled)")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many rows")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and scan from the start")
+    asyncio.run(main(parser.parse_args()))
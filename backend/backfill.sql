@@ -0,0 +1,60 @@
+-- Bulk write-back for the embedding backfill job (backend/backfill.py).
+-- Run after rag_schema.sql and chunk_schema.sql. Safe to re-run.
+
+-- Sets embedding + metadata.embedding_model for many rows in one statement.
+-- USAGE: supabase.rpc('bulk_update_chat_message_embeddings', {
+--          'updates': [{ 'id': '...', 'embedding': [...] }, ...], 'embedding_model': 'qwen3-embedding:latest' })
+create or replace function bulk_update_chat_message_embeddings (
+  updates jsonb,
+  embedding_model text
+)
+returns int
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  updated int;
+begin
+  update chat_messages
+  set
+    embedding = (u.value->>'embedding')::vector,
+    metadata = coalesce(chat_messages.metadata, '{}'::jsonb) || jsonb_build_object('embedding_model', embedding_model)
+  from jsonb_array_elements(updates) u
+  where chat_messages.id = (u.value->>'id')::uuid;
+  get diagnostics updated = row_count;
+  return updated;
+end;
+$$;
+
+revoke execute on function bulk_update_chat_message_embeddings from public, anon, authenticated;
+grant execute on function bulk_update_chat_message_embeddings to service_role;
+
+-- Same for chat_message_chunks (chunk_schema.sql), whose model tag is a column.
+-- USAGE: supabase.rpc('bulk_update_chat_message_chunk_embeddings', {
+--          'updates': [{ 'id': '...', 'embedding': [...] }, ...], 'embedding_model': 'qwen3-embedding:latest' })
+create or replace function bulk_update_chat_message_chunk_embeddings (
+  updates jsonb,
+  embedding_model text
+)
+returns int
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  updated int;
+begin
+  update chat_message_chunks
+  set
+    embedding = (u.value->>'embedding')::vector,
+    embedding_model = bulk_update_chat_message_chunk_embeddings.embedding_model
+  from jsonb_array_elements(updates) u
+  where chat_message_chunks.id = (u.value->>'id')::uuid;
+  get diagnostics updated = row_count;
+  return updated;
+end;
+$$;
+
+revoke execute on function bulk_update_chat_message_chunk_embeddings from public, anon, authenticated;
+grant execute on function bulk_update_chat_message_chunk_embeddings to service_role;
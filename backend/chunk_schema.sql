@@ -0,0 +1,80 @@
+-- Chunk-level embeddings for long chat messages.
+-- Run after rag_index.sql. Safe to re-run.
+--
+-- Messages longer than CHUNK_MAX_TOKENS (backend/chunking.py) are split into overlapping
+-- chunks by the persistence writer; each chunk gets its own embedding here. The parent
+-- message keeps its own row and embedding in chat_messages.
+
+-- 1. Chunk table
+create table if not exists chat_message_chunks (
+  id uuid default gen_random_uuid() primary key,
+  message_id uuid references chat_messages(id) on delete cascade not null,
+  agent_id uuid references agents(id) on delete cascade not null,
+  chunk_index int not null,
+  content text not null,
+  embedding vector(4096),
+  embedding_model text,             -- model that produced `embedding` (backfill.py re-embeds on a change)
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+  unique (message_id, chunk_index)
+);
+
+-- Tables created before the model tag
+alter table chat_message_chunks add column if not exists embedding_model text;
+
+create index if not exists chat_message_chunks_agent_id_idx on chat_message_chunks (agent_id);
+
+-- 2. Search over messages and chunks, collapsed to one row per parent message.
+-- `content` is the best-matching text: the chunk when a chunk won, else the whole message.
+-- USAGE: supabase.rpc('match_chat_message_chunks', { 'query_embedding': [...], 'match_threshold': 0.5,
+--          'match_count': 5, 'filter_agent_id': '...' })
+create or replace function match_chat_message_chunks (
+  query_embedding vector(4096),
+  match_threshold float,
+  match_count int,
+  filter_agent_id uuid,
+  candidate_factor int default 4    -- candidates per source = match_count * candidate_factor
+)
+returns table (
+  id uuid,
+  content text,
+  role text,
+  similarity float
+)
+language plpgsql
+as $$
+declare
+  candidate_count int := greatest(match_count * candidate_factor, match_count);
+begin
+  return query(
+    with message_hits as (
+      select
+        chat_messages.id as message_id,
+        chat_messages.content,
+        chat_messages.embedding <=> query_embedding as distance
+      from chat_messages
+      where chat_messages.agent_id = filter_agent_id
+      order by chat_messages.embedding <=> query_embedding
+      limit candidate_count
+    ), chunk_hits as (
+      select
+        chat_message_chunks.message_id,
+        chat_message_chunks.content,
+        chat_message_chunks.embedding <=> query_embedding as distance
+      from chat_message_chunks
+      where chat_message_chunks.agent_id = filter_agent_id
+      order by chat_message_chunks.embedding <=> query_embedding
+      limit candidate_count
+    ), best as (
+      select distinct on (hits.message_id) hits.message_id, hits.content, hits.distance
+      from (select * from message_hits union all select * from chunk_hits) hits
+      order by hits.message_id, hits.distance
+    )
+    select best.message_id, best.content, chat_messages.role, 1 - best.distance as similarity
+    from best
+    join chat_messages on chat_messages.id = best.message_id
+    where 1 - best.distance > match_threshold
+    order by best.distance
+    limit match_count
+  );
+end;
+$$;
@@ -0,0 +1,83 @@
+import os
+import re
+from typing import List
+
+# --- Chunking Configuration ---
+# Sizes are in tokens. The embedding model truncates long inputs, so long messages are
+# split into overlapping chunks that are embedded and searched separately.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+CHUNK_ENCODING = os.getenv("CHUNK_ENCODING", "cl100k_base")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(CHUNK_ENCODING)
+except Exception:  # tiktoken missing or encoding not downloadable: approximate
+    _encoding = None
+
+# Fallback tokenizer: words and punctuation runs, each with its trailing whitespace
+_TOKEN_PATTERN = re.compile(r"\w+\s*|[^\w\s]+\s*|\s+")
+
+
+def _encode(text: str) -> list:
+    if _encoding is not None:
+        return _encoding.encode(text, disallowed_special=())
+    return _TOKEN_PATTERN.findall(text)
+
+
+def _decode(tokens: list) -> str:
+    if _encoding is not None:
+        return _encoding.decode(tokens)
+    return "".join(tokens)
+
+
+def count_tokens(text: str) -> int:
+    return len(_encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of `text` that is at most `max_tokens` tokens."""
+    tokens = _encode(text)
+    return text if len(tokens) <= max_tokens else _decode(tokens[:max(max_tokens, 0)])
+
+
+def _break_point(tokens: list, start: int, end: int) -> int:
+    """
+    Moves a window end back to the last paragraph/line/sentence break in the window's
+    final quarter, so chunks don't stop mid-sentence when avoidable.
+    """
+    floor = start + (end - start) * 3 // 4
+    for separator in ("\n\n", "\n", ". "):
+        for i in range(end - 1, floor - 1, -1):
+            if separator in _decode(tokens[i:i + 1]):
+                return i + 1
+    return end
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> List[str]:
+    """
+    Splits `text` into chunks of at most `max_tokens`, each starting `overlap_tokens`
+    before the previous one ended. Text that fits in one chunk is returned as is.
+    """
+    tokens = _encode(text)
+    if len(tokens) <= max_tokens:
+        return [text] if text.strip() else []
+
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        end = min(start + max_tokens, len(tokens))
+        if end < len(tokens):
+            end = _break_point(tokens, start, end)
+        chunk = _decode(tokens[start:end]).strip()
+        if chunk:
+            chunks.append(chunk)
+        if end == len(tokens):
+            break
+        start = end - overlap_tokens
+    return chunks
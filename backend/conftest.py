@@ -0,0 +1,6 @@
+import os
+
+# Tests run with the memory cache tiers only, so runs don't depend on (or pollute) the
+# on-disk caches under backend/.cache. Set before any test module imports the caching modules.
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("LLM_CACHE_PATH", "")
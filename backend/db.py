@@ -1,5 +1,8 @@
+import asyncio
 import os
-from supabase import create_client, Client
+from typing import Optional
+from supabase import create_client, Client, acreate_client, AsyncClient
+from supabase.lib.client_options import AsyncClientOptions
 from dotenv import load_dotenv
 
 load_dotenv(dotenv_path="backend/.env")
@@ -7,8 +10,53 @@ load_dotenv(dotenv_path="backend/.env")
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
 
+# Timeout (seconds) for PostgREST calls made through the async client
+POSTGREST_TIMEOUT = int(os.getenv("POSTGREST_TIMEOUT", "10"))
+
 if not url or not key:
     print("Warning: SUPABASE_URL or SUPABASE_KEY not found in environment variables.")
     supabase: Client = None
 else:
     supabase: Client = create_client(url, key)
+
+# --- Async Data Access ---
+# One AsyncClient per process. Its PostgREST session is an httpx.AsyncClient, so
+# connections are pooled and kept alive across requests instead of being re-opened.
+# Routes should use this (await get_async_supabase()) rather than the sync client above,
+# which blocks a threadpool worker for the whole PostgREST round trip.
+_async_supabase: Optional[AsyncClient] = None
+_async_lock = asyncio.Lock()
+
+
+async def get_async_supabase() -> AsyncClient:
+    """
+    Returns the shared async Supabase client, creating it on first use.
+    """
+    global _async_supabase
+    if _async_supabase is not None:
+        return _async_supabase
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL or SUPABASE_KEY not found in environment variables.")
+
+    async with _async_lock:
+        if _async_supabase is None:
+            _async_supabase = await acreate_client(
+                url,
+                key,
+                options=AsyncClientOptions(postgrest_client_timeout=POSTGREST_TIMEOUT),
+            )
+    return _async_supabase
+
+
+async def close_async_supabase() -> None:
+    """
+    Closes the pooled connections of the shared async client (called on app shutdown).
+    """
+    global _async_supabase
+    if _async_supabase is None:
+        return
+    try:
+        await _async_supabase.postgrest.aclose()
+    except Exception as e:
+        print(f"Warning: Failed to close async Supabase client: {e}")
+    _async_supabase = None
@@ -1,8 +1,12 @@
 import asyncio
 import os
+import sys
 from supabase import create_client, Client
 from dotenv import load_dotenv
-from embeddings import get_embedding
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.embeddings import get_embedding
 
 # Load env
 load_dotenv()
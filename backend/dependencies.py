@@ -1,35 +1,124 @@
+import asyncio
+import hashlib
+import os
+from typing import Optional
+
+import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from gotrue.errors import AuthApiError
-from backend.db import supabase
+from backend.cache import TTLCache
+from backend.db import get_async_supabase
 
 security = HTTPBearer()
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# --- Auth Configuration ---
+# "remote": every request is verified by Supabase Auth (get_user).
+# "local":  signature/expiry are checked in-process and verified users are cached
+#           until their token expires; Supabase Auth is only hit on a cache miss.
+AUTH_VERIFY_MODE = os.getenv("AUTH_VERIFY_MODE", "remote").lower()
+# When enabled, local mode still asks Supabase Auth on every request (catches revoked sessions).
+AUTH_REVOCATION_CHECK = os.getenv("AUTH_REVOCATION_CHECK", "false").lower() == "true"
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+AUTH_JWT_AUDIENCE = os.getenv("AUTH_JWT_AUDIENCE", "authenticated")
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024"))
+AUTH_JWKS_CACHE_SECONDS = int(os.getenv("AUTH_JWKS_CACHE_SECONDS", "600"))
+
+ALLOWED_JWT_ALGORITHMS = {"HS256", "RS256", "ES256"}
+
+# token hash -> user, evicted by LRU or when the token's `exp` passes
+_token_cache = TTLCache(maxsize=AUTH_TOKEN_CACHE_SIZE)
+_jwks_client: Optional[jwt.PyJWKClient] = None
+
+
+def _get_jwks_client() -> jwt.PyJWKClient:
+    """
+    Lazily creates the JWKS client for asymmetric Supabase signing keys.
+    PyJWKClient keeps fetched keys in memory, so the key set is downloaded once per lifespan.
+    """
+    global _jwks_client
+    if _jwks_client is None:
+        jwks_url = f"{os.environ.get('SUPABASE_URL', '').rstrip('/')}/auth/v1/.well-known/jwks.json"
+        _jwks_client = jwt.PyJWKClient(jwks_url, cache_keys=True, lifespan=AUTH_JWKS_CACHE_SECONDS)
+    return _jwks_client
+
+
+def verify_token_locally(token: str) -> dict:
+    """
+    Checks the JWT signature and expiry in-process.
+    HS256 tokens are verified with SUPABASE_JWT_SECRET, asymmetric ones against the project's JWKS.
+    Returns the decoded claims or raises jwt.PyJWTError (including PyJWKClientError for an
+    unknown key id or a failed JWKS fetch). May fetch the JWKS over HTTP, so call it off the event loop.
+    """
+    algorithm = jwt.get_unverified_header(token).get("alg")
+    if algorithm not in ALLOWED_JWT_ALGORITHMS:
+        raise jwt.InvalidTokenError(f"Unsupported signing algorithm: {algorithm}")
+
+    if algorithm == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise jwt.InvalidTokenError("SUPABASE_JWT_SECRET is not configured")
+        key = SUPABASE_JWT_SECRET
+    else:
+        key = _get_jwks_client().get_signing_key_from_jwt(token).key
+
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=AUTH_JWT_AUDIENCE,
+        options={"require": ["exp", "sub"]},
+    )
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
     Verifies the JWT token from the Authorization header using Supabase Auth.
     Returns the user dictionary if valid.
+
+    Note: FastAPI caches dependencies per request, so declaring this both on a router
+    and on an endpoint still resolves it once per request.
     """
     token = credentials.credentials
-    # print(f"DEBUG: Verifying token: {token[:10]}...") 
+    cache_key = None
+    expires_at = None
+
+    if AUTH_VERIFY_MODE == "local":
+        try:
+            # JWKS fetches (cache miss, key rotation) are blocking HTTP calls
+            claims = await asyncio.to_thread(verify_token_locally, token)
+        except jwt.ExpiredSignatureError:
+            raise _unauthorized("Invalid authentication credentials: token has expired")
+        except jwt.PyJWTError as e:
+            print(f"DEBUG: Local Auth Error: {e}")
+            raise _unauthorized(f"Invalid authentication credentials: {e}")
+
+        cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        expires_at = claims["exp"]
+        if not AUTH_REVOCATION_CHECK:
+            cached_user = _token_cache.get(cache_key)
+            if cached_user is not None:
+                return cached_user
+
     try:
         # Supabase-py's auth.get_user(token) verifies the JWT
-        user_response = supabase.auth.get_user(token)
-        # print(f"DEBUG: User verified: {user_response.user.id}")
-        return user_response.user
+        client = await get_async_supabase()
+        user_response = await client.auth.get_user(token)
     except AuthApiError as e:
         print(f"DEBUG: Auth Error: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Invalid authentication credentials: {e.message}",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _unauthorized(f"Invalid authentication credentials: {e.message}")
     except Exception as e:
         print(f"DEBUG: Unexpected Auth Error: {e}")
         raise e
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+
+    if cache_key is not None:
+        _token_cache.set(cache_key, user_response.user, expires_at=expires_at)
+    return user_response.user
+
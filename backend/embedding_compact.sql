@@ -0,0 +1,98 @@
+-- Compact embedding representations for chat_messages + two-pass search.
+-- Requires pgvector >= 0.7 (halfvec, subvector, l2_normalize, binary_quantize).
+-- Run after rag_index.sql. Safe to re-run.
+--
+-- The full vector(4096) `embedding` stays the source of truth (what the app writes and
+-- what exact rescoring uses). Two derived columns are kept in sync by Postgres:
+--   embedding_short: Matryoshka-style truncation to the first 1024 dims, re-normalized,
+--                    stored as halfvec (2 KB instead of 16 KB, indexable by HNSW)
+--   embedding_bin:   sign bits of the full vector (512 bytes), for Hamming-distance first pass
+-- Adding the generated columns computes them for all existing rows (migration path);
+-- this rewrites the table once, so run it off-peak.
+-- To use another dimension, change 1024 here AND in match_chat_messages_compact below.
+
+-- 1. Derived columns
+alter table chat_messages add column if not exists embedding_short halfvec(1024)
+  generated always as (l2_normalize(subvector(embedding, 1, 1024))::halfvec(1024)) stored;
+
+alter table chat_messages add column if not exists embedding_bin bit(4096)
+  generated always as (binary_quantize(embedding)::bit(4096)) stored;
+
+-- 2. ANN indexes on the compact columns (see manage_chat_messages_index in rag_index.sql)
+select manage_chat_messages_index('embedding_short', 'hnsw');
+select manage_chat_messages_index('embedding_bin', 'hnsw');
+
+-- 3. Two-pass search: candidates from a compact index, exact cosine rescoring on the full vector.
+-- USAGE: supabase.rpc('match_chat_messages_compact', { 'query_embedding': [...], 'match_threshold': 0.5,
+--          'match_count': 5, 'filter_agent_id': '...', 'search_mode': 'binary', 'candidate_factor': 10 })
+create or replace function match_chat_messages_compact (
+  query_embedding vector(4096),
+  match_threshold float,
+  match_count int,
+  filter_agent_id uuid,
+  search_mode text default 'short',   -- 'short' (truncated halfvec) | 'binary' (Hamming)
+  candidate_factor int default 10,    -- first-pass candidates = match_count * candidate_factor
+  ef_search int default null
+)
+returns table (
+  id uuid,
+  content text,
+  role text,
+  similarity float
+)
+language plpgsql
+as $$
+declare
+  candidate_count int := greatest(match_count * candidate_factor, match_count);
+begin
+  if search_mode not in ('short', 'binary') then
+    raise exception 'Unknown search_mode: %', search_mode;
+  end if;
+  if ef_search is not null then
+    perform set_config('hnsw.ef_search', ef_search::text, true);
+  end if;
+  begin
+    perform set_config('hnsw.iterative_scan', 'relaxed_order', true);
+  exception when others then
+    null; -- older pgvector: setting not available
+  end;
+
+  if search_mode = 'binary' then
+    return query(
+      with candidates as (
+        select chat_messages.id, chat_messages.content, chat_messages.role, chat_messages.embedding
+        from chat_messages
+        where chat_messages.agent_id = filter_agent_id
+        order by chat_messages.embedding_bin <~> binary_quantize(query_embedding)::bit(4096)
+        limit candidate_count
+      ), rescored as (
+        select c.id, c.content, c.role, c.embedding <=> query_embedding as distance
+        from candidates c
+      )
+      select r.id, r.content, r.role, 1 - r.distance as similarity
+      from rescored r
+      where 1 - r.distance > match_threshold
+      order by r.distance
+      limit match_count
+    );
+  else
+    return query(
+      with candidates as (
+        select chat_messages.id, chat_messages.content, chat_messages.role, chat_messages.embedding
+        from chat_messages
+        where chat_messages.agent_id = filter_agent_id
+        order by chat_messages.embedding_short <=> l2_normalize(subvector(query_embedding, 1, 1024))::halfvec(1024)
+        limit candidate_count
+      ), rescored as (
+        select c.id, c.content, c.role, c.embedding <=> query_embedding as distance
+        from candidates c
+      )
+      select r.id, r.content, r.role, 1 - r.distance as similarity
+      from rescored r
+      where 1 - r.distance > match_threshold
+      order by r.distance
+      limit match_count
+    );
+  end if;
+end;
+$$;
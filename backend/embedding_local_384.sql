@@ -0,0 +1,43 @@
+-- Migration: 4096-dim embeddings (qwen3-embedding via Ollama) -> 384-dim (EMBEDDING_PROVIDER=local,
+-- BAAI/bge-small-en-v1.5). Vectors of one size can't be cast to the other, so existing
+-- embeddings are cleared and re-embedded by the backfill job.
+--
+-- Steps:
+--   1. Run this file.
+--   2. Re-create the search functions at 384 dims:
+--        for f in rag_index.sql chunk_schema.sql hybrid_search.sql; do
+--          sed 's/vector(4096)/vector(384)/g' "backend/$f" | psql "$DATABASE_URL"
+--        done
+--      embedding_compact.sql does not apply: a 384-dim `embedding` is small enough to index
+--      directly, so its derived columns and two-pass search are dropped below.
+--   3. Start the app with EMBEDDING_PROVIDER=local and EMBEDDING_DIMENSIONS=384.
+--   4. Index and re-embed:
+--        supabase.rpc('manage_chat_messages_index', { 'index_column': 'embedding' })
+--        POST /admin/rag/backfill
+-- The app refuses to start while EMBEDDING_DIMENSIONS doesn't match the model (embeddings.py).
+
+begin;
+
+-- 1. Functions taking vector(4096). Argument types ignore the dimension, so these names
+-- would otherwise stay as a second overload next to the re-created 384-dim ones.
+drop function if exists match_chat_messages(vector, float, int, uuid, int, int);
+drop function if exists match_chat_messages(vector, float, int, uuid);
+drop function if exists match_chat_message_chunks(vector, float, int, uuid, int);
+drop function if exists match_chat_messages_compact(vector, float, int, uuid, text, int, int);
+drop function if exists hybrid_search_chat_messages(text, vector, float, int, uuid, float, float, int, int, int);
+
+-- 2. Derived compact columns (embedding_compact.sql); their ANN indexes go with them
+alter table chat_messages drop column if exists embedding_short;
+alter table chat_messages drop column if exists embedding_bin;
+
+-- 3. Clear and resize the embedding columns; null embeddings are picked up by the backfill
+update chat_messages
+set embedding = null,
+    metadata = coalesce(metadata, '{}'::jsonb) - 'embedding_model'
+where embedding is not null;
+alter table chat_messages alter column embedding type vector(384);
+
+update chat_message_chunks set embedding = null, embedding_model = null where embedding is not null;
+alter table chat_message_chunks alter column embedding type vector(384);
+
+commit;
@@ -1,32 +1,420 @@
-import requests
-from typing import List, Optional
+import abc
+import asyncio
+import hashlib
+import os
+import threading
+import httpx
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from backend.cache import TTLCache, SQLiteCache
 
 # Configuration
-OLLAMA_BASE_URL = "http://localhost:11434"
-EMBEDDING_MODEL = "qwen3-embedding:latest"
+# "ollama": HTTP calls to an Ollama server
+# "local":  in-process ONNX model via fastembed (optional dependency: pip install fastembed)
+# NOTE: the schema stores vector(4096) (chat_messages.embedding, chat_message_chunks.embedding,
+# the embedding_compact.sql columns and every match/search function). The default local model
+# (bge-small) makes 384-dim vectors, so switching providers or models to another dimension needs
+# a schema migration (all of the above changed to vector(N), EMBEDDING_DIMENSIONS=N), then a
+# re-embed (backfill.py); embedding_local_384.sql is that migration for the local default.
+# The app refuses to start if the model doesn't match EMBEDDING_DIMENSIONS.
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "ollama")
+_DEFAULT_MODELS = {"ollama": "qwen3-embedding:latest", "local": "BAAI/bge-small-en-v1.5"}
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", _DEFAULT_MODELS.get(EMBEDDING_PROVIDER, _DEFAULT_MODELS["ollama"]))
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "4096"))   # must match the vector(N) columns
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "30"))
+# Bounds for one /api/embed request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_MAX_CHARS = int(os.getenv("EMBEDDING_BATCH_MAX_CHARS", "32000"))
+# Max in-flight requests (and pooled connections) per embedding backend
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+# Local provider: how long to wait for concurrent callers to fill a micro-batch
+EMBEDDING_MICROBATCH_WAIT_MS = float(os.getenv("EMBEDDING_MICROBATCH_WAIT_MS", "5"))
+EMBEDDING_LOCAL_THREADS = int(os.getenv("EMBEDDING_LOCAL_THREADS")) if os.getenv("EMBEDDING_LOCAL_THREADS") else None
 
-def get_embedding(text: str, model: str = EMBEDDING_MODEL) -> Optional[List[float]]:
+# --- Embedding Cache ---
+# Content-addressed by hash(model, text): an in-memory LRU in front of a SQLite file
+# that survives restarts. Set EMBEDDING_CACHE_PATH="" to disable the disk tier.
+# A 4096-dim vector is ~16 KB on disk, so the disk tier is bounded by rows and age.
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "backend/.cache/embeddings.sqlite")
+EMBEDDING_CACHE_DISK_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ROWS", "20000"))        # ~330 MB at 4096 dims
+EMBEDDING_CACHE_DISK_TTL = float(os.getenv("EMBEDDING_CACHE_DISK_TTL", str(30 * 24 * 3600)))   # seconds
+
+_memory_cache = TTLCache(maxsize=EMBEDDING_CACHE_SIZE)
+_disk_cache = SQLiteCache(
+    EMBEDDING_CACHE_PATH, table="embeddings", maxsize=EMBEDDING_CACHE_DISK_MAX_ROWS, ttl=EMBEDDING_CACHE_DISK_TTL,
+) if EMBEDDING_CACHE_PATH else None
+_cache_counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+
+def _cache_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+async def get_cached_embeddings(texts: List[str], model: str = EMBEDDING_MODEL) -> Dict[str, List[float]]:
     """
-    Generates a vector embedding for the given text using Ollama.
-    Returns None if generation fails.
+    Looks texts up in the memory tier, then the disk tier (promoting disk hits).
+    The disk lookup is one query for all memory misses, run off the event loop.
+    Returns {text: vector} for the hits.
     """
-    url = f"{OLLAMA_BASE_URL}/api/embeddings"
-    payload = {
-        "model": model,
-        "prompt": text
+    found: Dict[str, List[float]] = {}
+    missing: Dict[str, str] = {}   # key -> text
+    for text in dict.fromkeys(texts):
+        key = _cache_key(text, model)
+        vector = _memory_cache.get(key)
+        if vector is not None:
+            _cache_counters["memory_hits"] += 1
+            found[text] = vector
+        else:
+            missing[key] = text
+
+    if missing and _disk_cache is not None:
+        try:
+            blobs = await asyncio.to_thread(_disk_cache.get_many, list(missing))
+        except Exception as e:
+            print(f"Embedding disk cache read failed: {e}")
+            blobs = {}
+        for key, blob in blobs.items():
+            vector = array("f", blob).tolist()
+            _memory_cache.set(key, vector)
+            _cache_counters["disk_hits"] += 1
+            found[missing.pop(key)] = vector
+
+    _cache_counters["misses"] += len(missing)
+    return found
+
+
+async def cache_embeddings(vectors: Dict[str, List[float]], model: str = EMBEDDING_MODEL) -> None:
+    """Stores {text: vector} in both tiers (one disk transaction, off the event loop)."""
+    items = []
+    for text, vector in vectors.items():
+        key = _cache_key(text, model)
+        _memory_cache.set(key, vector)
+        # float32 is what pgvector stores, so nothing is lost by packing to 4 bytes
+        items.append((key, array("f", vector).tobytes()))
+    if items and _disk_cache is not None:
+        try:
+            await asyncio.to_thread(_disk_cache.set_many, items)
+        except Exception as e:
+            print(f"Embedding disk cache write failed: {e}")
+
+
+def get_embedding_cache_stats() -> dict:
+    lookups = sum(_cache_counters.values())
+    hits = _cache_counters["memory_hits"] + _cache_counters["disk_hits"]
+    return {
+        **_cache_counters,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "memory_size": len(_memory_cache),
+        "disk_size": len(_disk_cache) if _disk_cache is not None else 0,
+        "disk_max_rows": EMBEDDING_CACHE_DISK_MAX_ROWS if _disk_cache is not None else 0,
     }
-    
-    try:
-        response = requests.post(url, json=payload, timeout=10)
+
+
+def _batches(texts: List[str], max_items: int, max_chars: int) -> List[List[int]]:
+    """
+    Groups indexes of `texts` into batches bounded by item count and total characters.
+    A single text longer than `max_chars` still gets a batch of its own.
+    """
+    batches, current, current_chars = [], [], 0
+    for i, text in enumerate(texts):
+        if current and (len(current) >= max_items or current_chars + len(text) > max_chars):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(i)
+        current_chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+# --- Embedding Providers ---
+
+class EmbeddingProvider(abc.ABC):
+    """
+    Interface of an embedding backend. `embed` returns one vector per input, in order,
+    and raises on any failure (callers retry items individually).
+    """
+
+    @abc.abstractmethod
+    async def embed(self, inputs: List[str], model: str) -> List[List[float]]:
+        ...
+
+    async def aclose(self) -> None:
+        pass
+
+
+class OllamaEmbeddingClient(EmbeddingProvider):
+    """
+    Async client for one Ollama server. Connections are pooled and kept alive, and a
+    semaphore bounds how many embed requests are in flight against that server at once.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, max_concurrency: int = EMBEDDING_MAX_CONCURRENCY):
+        self.base_url = (base_url or OLLAMA_BASE_URL).rstrip("/")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(EMBEDDING_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+
+    async def embed(self, inputs: List[str], model: str) -> List[List[float]]:
+        """
+        One call to Ollama's multi-input /api/embed endpoint. Raises on any failure.
+        """
+        async with self._semaphore:
+            response = await self._http.post("/api/embed", json={"model": model, "input": inputs})
         response.raise_for_status()
-        data = response.json()
-        return data.get("embedding")
-    except requests.exceptions.RequestException as e:
-        print(f"Error generating embedding: {e}")
-        return None
+        vectors = response.json().get("embeddings") or []
+        if len(vectors) != len(inputs):
+            raise ValueError(f"Expected {len(inputs)} embeddings, got {len(vectors)}")
+        return vectors
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+# Loaded ONNX models, shared by every LocalEmbeddingClient in the process
+_local_models: Dict[str, object] = {}
+_local_models_lock = threading.Lock()
+
+
+def _load_local_model(model: str):
+    with _local_models_lock:
+        if model not in _local_models:
+            try:
+                from fastembed import TextEmbedding
+            except ImportError:
+                raise RuntimeError("EMBEDDING_PROVIDER=local requires fastembed (pip install fastembed)")
+            _local_models[model] = TextEmbedding(model_name=model, threads=EMBEDDING_LOCAL_THREADS)
+        return _local_models[model]
+
+
+class LocalEmbeddingClient(EmbeddingProvider):
+    """
+    In-process CPU embeddings (ONNX runtime via fastembed), no HTTP hop.
+    Inputs from concurrent callers are queued and run together as micro-batches of up to
+    `max_batch_size`, waiting at most `max_wait_ms` for a batch to fill. Inference runs on
+    one worker thread (ONNX runtime parallelizes inside a batch), keeping the event loop free.
+    """
+
+    def __init__(self, max_batch_size: int = EMBEDDING_BATCH_SIZE, max_wait_ms: float = EMBEDDING_MICROBATCH_WAIT_MS):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: "asyncio.Queue[Tuple[str, str, asyncio.Future]]" = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self._batcher: Optional[asyncio.Task] = None
+
+    def _encode(self, model: str, texts: List[str]) -> List[List[float]]:
+        """Runs on the worker thread."""
+        return [vector.tolist() for vector in _load_local_model(model).embed(texts, batch_size=len(texts))]
+
+    async def embed(self, inputs: List[str], model: str) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        if self._batcher is None or self._batcher.done():
+            self._batcher = asyncio.create_task(self._run_batches())
+        futures = []
+        for text in inputs:
+            future = loop.create_future()
+            self._queue.put_nowait((model, text, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _next_batch(self) -> List[Tuple[str, str, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            by_model: Dict[str, list] = {}
+            for model, text, future in batch:
+                by_model.setdefault(model, []).append((text, future))
+            for model, items in by_model.items():
+                await self._run_batch(loop, model, items)
+
+    async def _run_batch(self, loop, model: str, items: list) -> None:
+        """
+        A micro-batch mixes inputs from unrelated callers, so when it fails each input is
+        retried on its own and only the bad ones fail.
+        """
+        try:
+            vectors = await loop.run_in_executor(self._executor, self._encode, model, [text for text, _ in items])
+        except Exception as e:
+            if len(items) > 1:
+                for item in items:
+                    await self._run_batch(loop, model, [item])
+            elif not items[0][1].done():
+                items[0][1].set_exception(e)
+            return
+        for (_, future), vector in zip(items, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    async def aclose(self) -> None:
+        if self._batcher is not None:
+            self._batcher.cancel()
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Embedding client closed"))
+        self._executor.shutdown(wait=False)
+
+
+def create_embedding_client(base_url: Optional[str] = None) -> EmbeddingProvider:
+    """A new client for the configured EMBEDDING_PROVIDER."""
+    if EMBEDDING_PROVIDER == "local":
+        return LocalEmbeddingClient()
+    if EMBEDDING_PROVIDER != "ollama":
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER: {EMBEDDING_PROVIDER}")
+    return OllamaEmbeddingClient(base_url)
+
+
+# One client per backend (URL for Ollama), bound to the event loop that created it
+_clients: Dict[str, EmbeddingProvider] = {}
+
+
+def get_embedding_client(base_url: Optional[str] = None) -> EmbeddingProvider:
+    key = "local" if EMBEDDING_PROVIDER == "local" else (base_url or OLLAMA_BASE_URL).rstrip("/")
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = create_embedding_client(base_url)
+    return client
+
+
+async def close_embedding_clients() -> None:
+    """Closes pooled connections (called on app shutdown)."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+async def _embed_batch(client: EmbeddingProvider, texts: List[str], model: str) -> List[Optional[List[float]]]:
+    try:
+        return await client.embed(texts, model)
     except Exception as e:
-        print(f"Unexpected error in get_embedding: {e}")
-        return None
+        if len(texts) == 1:
+            print(f"Error generating embedding: {e}")
+            return [None]
+        print(f"Batch embedding failed ({e}); retrying {len(texts)} items individually.")
+    # Retry one by one so a single bad input only fails itself
+    results = await asyncio.gather(*[_embed_batch(client, [text], model) for text in texts])
+    return [r[0] for r in results]
+
+
+async def aget_embeddings(
+    texts: List[str],
+    model: str = EMBEDDING_MODEL,
+    client: Optional[EmbeddingProvider] = None,
+) -> List[Optional[List[float]]]:
+    """
+    Embeds many texts with as few round trips as possible.
+    Cached texts are skipped, duplicates are sent once, and the rest go to the provider in
+    size-bounded batches (concurrently, up to the client's limit). Results keep the
+    input order; an item is None if it failed.
+    """
+    client = client or get_embedding_client()
+    results: List[Optional[List[float]]] = [None] * len(texts)
+
+    # text -> positions in `texts` that still need a vector
+    cached = await get_cached_embeddings(texts, model)
+    pending = {}
+    for i, text in enumerate(texts):
+        if text in cached:
+            results[i] = cached[text]
+        else:
+            pending.setdefault(text, []).append(i)
+
+    unique_texts = list(pending.keys())
+    batches = [
+        [unique_texts[i] for i in batch]
+        for batch in _batches(unique_texts, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_MAX_CHARS)
+    ]
+    batch_results = await asyncio.gather(*[_embed_batch(client, batch, model) for batch in batches])
+
+    new_vectors = {}
+    for batch_texts, vectors in zip(batches, batch_results):
+        for text, vector in zip(batch_texts, vectors):
+            if vector is None:
+                continue
+            if len(vector) != EMBEDDING_DIMENSIONS:
+                # Would fail every insert/search against the vector(N) schema; treat as a failed item
+                print(f"Embedding has {len(vector)} dimensions, schema expects {EMBEDDING_DIMENSIONS}; discarded.")
+                continue
+            new_vectors[text] = vector
+            for i in pending[text]:
+                results[i] = vector
+    await cache_embeddings(new_vectors, model)
+
+    return results
+
+
+async def check_embedding_dimensions() -> None:
+    """
+    Startup check: embeds a probe text and raises RuntimeError if the model's dimension doesn't
+    match EMBEDDING_DIMENSIONS. If the provider can't be reached, only logs a warning.
+    """
+    try:
+        vector = (await get_embedding_client().embed(["dimension check"], EMBEDDING_MODEL))[0]
+    except Exception as e:
+        print(f"Warning: could not verify embedding dimensions ({EMBEDDING_PROVIDER}/{EMBEDDING_MODEL}): {e}")
+        return
+    if len(vector) != EMBEDDING_DIMENSIONS:
+        raise RuntimeError(
+            f"Embedding model {EMBEDDING_MODEL} ({EMBEDDING_PROVIDER}) makes {len(vector)}-dim vectors but the "
+            f"schema expects {EMBEDDING_DIMENSIONS}. Migrate the vector columns and search functions to "
+            f"vector({len(vector)}) and set EMBEDDING_DIMENSIONS, or use a {EMBEDDING_DIMENSIONS}-dim model."
+        )
+
+
+async def aget_embedding(text: str, model: str = EMBEDDING_MODEL) -> Optional[List[float]]:
+    """
+    Generates a vector embedding for the given text with the configured provider.
+    Identical (model, text) pairs are served from the embedding cache.
+    Returns None if generation fails.
+    """
+    return (await aget_embeddings([text], model))[0]
+
+
+# --- Sync Wrappers (scripts, threads without an event loop) ---
+
+def get_embeddings(texts: List[str], model: str = EMBEDDING_MODEL) -> List[Optional[List[float]]]:
+    """
+    Blocking version of aget_embeddings. Must not be called from a running event loop;
+    async code should await aget_embeddings instead.
+    """
+    async def run():
+        # The shared clients belong to the server's loop, so use a short-lived one here
+        client = create_embedding_client()
+        try:
+            return await aget_embeddings(texts, model, client=client)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run())
+
+
+def get_embedding(text: str, model: str = EMBEDDING_MODEL) -> Optional[List[float]]:
+    """Blocking version of aget_embedding."""
+    return get_embeddings([text], model)[0]
 
 if __name__ == "__main__":
     # Simple test
@@ -37,3 +425,4 @@ if __name__ == "__main__":
         print(f"First 5 values: {vector[:5]}")
     else:
         print("Failed to generate embedding. Make sure Ollama is running and 'nomic-embed-text' is pulled.")
+    print(f"Cache stats: {get_embedding_cache_stats()}")
@@ -0,0 +1,63 @@
+import os
+from typing import Any, Dict, List, Optional
+from supabase import AsyncClient
+from backend.cache import TTLCache
+
+# --- Entity Cache ---
+# Read-through cache for rows read on every request (agents, project ownership).
+# ai_models is cached by the LLM registry (agents/llm_registry.py), not here.
+# Keyed by (table, id). Routes that write these rows invalidate them; the TTL bounds
+# staleness for writes made outside this API (e.g. directly in Supabase).
+ENTITY_CACHE_TTL = float(os.getenv("ENTITY_CACHE_TTL", "30"))
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", "4096"))
+
+_cache = TTLCache(maxsize=ENTITY_CACHE_SIZE, ttl=ENTITY_CACHE_TTL)
+
+
+async def get_agent(db: AsyncClient, agent_id: str) -> Optional[Dict[str, Any]]:
+    """The agents row, or None if it doesn't exist (misses aren't cached)."""
+    key = ("agents", str(agent_id))
+    agent = _cache.get(key)
+    if agent is None:
+        response = await db.table("agents").select("*").eq("id", str(agent_id)).execute()
+        if not response.data:
+            return None
+        agent = response.data[0]
+        _cache.set(key, agent)
+    return agent
+
+
+async def get_project_agents(db: AsyncClient, project_id: str) -> List[Dict[str, Any]]:
+    key = ("project_agents", str(project_id))
+    agents = _cache.get(key)
+    if agents is None:
+        response = await db.table("agents").select("*").eq("project_id", str(project_id)).execute()
+        agents = response.data or []
+        _cache.set(key, agents)
+    return agents
+
+
+async def user_owns_project(db: AsyncClient, project_id: str, user_id: str) -> bool:
+    """Ownership check for project sub-resources. Only positive results are cached."""
+    key = ("projects", str(project_id), str(user_id))
+    if _cache.get(key):
+        return True
+    response = await db.table("projects").select("id").eq("id", str(project_id)).eq("owner_id", user_id).execute()
+    if not response.data:
+        return False
+    _cache.set(key, True)
+    return True
+
+
+def invalidate_agent(agent_id: str, project_id: Optional[str] = None) -> None:
+    _cache.pop(("agents", str(agent_id)))
+    if project_id is not None:
+        _cache.pop(("project_agents", str(project_id)))
+
+
+def invalidate_project_agents(project_id: str) -> None:
+    _cache.pop(("project_agents", str(project_id)))
+
+
+def get_entity_cache_stats() -> dict:
+    return _cache.stats()
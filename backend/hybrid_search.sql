@@ -0,0 +1,93 @@
+-- Hybrid lexical + vector search for chat_messages (reciprocal rank fusion).
+-- Run after rag_index.sql. Safe to re-run.
+--
+-- Vector search alone misses exact identifiers, file names and error strings; full-text
+-- search catches those. Both rankings are computed and fused in one round trip:
+--   score = full_text_weight / (rrf_k + lexical_rank) + semantic_weight / (rrf_k + vector_rank)
+-- A message missing from one ranking just gets no contribution from it.
+-- Adding the generated column computes it for all existing rows (rewrites the table once).
+
+-- 1. Full-text column + GIN index
+alter table chat_messages add column if not exists content_tsv tsvector
+  generated always as (to_tsvector('english', coalesce(content, ''))) stored;
+
+create index if not exists chat_messages_content_tsv_idx on chat_messages using gin (content_tsv);
+
+-- 2. Hybrid search
+-- USAGE: supabase.rpc('hybrid_search_chat_messages', { 'query_text': 'ECONNRESET in worker.py',
+--          'query_embedding': [...], 'match_threshold': 0.5, 'match_count': 5, 'filter_agent_id': '...' })
+-- Query terms are OR-ed (a question rarely shares every word with the answer) and ranked
+-- with ts_rank_cd. `match_threshold` only drops vector-only hits; lexical hits are always kept.
+-- `similarity` is the cosine similarity, null for lexical-only hits.
+create or replace function hybrid_search_chat_messages (
+  query_text text,
+  query_embedding vector(4096),
+  match_threshold float,
+  match_count int,
+  filter_agent_id uuid,
+  full_text_weight float default 1.0,
+  semantic_weight float default 1.0,
+  rrf_k int default 50,
+  candidate_count int default null,   -- per-ranking candidates, default match_count * 4
+  ef_search int default null
+)
+returns table (
+  id uuid,
+  content text,
+  role text,
+  similarity float,
+  score float
+)
+language plpgsql
+as $$
+declare
+  n int := coalesce(candidate_count, match_count * 4);
+  lexical_query tsquery := nullif(replace(plainto_tsquery('english', query_text)::text, ' & ', ' | '), '')::tsquery;
+begin
+  if ef_search is not null then
+    perform set_config('hnsw.ef_search', ef_search::text, true);
+  end if;
+  begin
+    perform set_config('hnsw.iterative_scan', 'relaxed_order', true);
+  exception when others then
+    null; -- older pgvector: setting not available
+  end;
+
+  return query(
+    with lexical as (
+      select
+        chat_messages.id,
+        row_number() over (order by ts_rank_cd(chat_messages.content_tsv, lexical_query) desc) as rank_ix
+      from chat_messages
+      where chat_messages.agent_id = filter_agent_id
+        and chat_messages.content_tsv @@ lexical_query
+      order by rank_ix
+      limit n
+    ), semantic as (
+      select
+        chat_messages.id,
+        chat_messages.embedding <=> query_embedding as distance,
+        row_number() over (order by chat_messages.embedding <=> query_embedding) as rank_ix
+      from chat_messages
+      where chat_messages.agent_id = filter_agent_id
+        and chat_messages.embedding is not null
+      order by chat_messages.embedding <=> query_embedding
+      limit n
+    ), fused as (
+      select
+        coalesce(lexical.id, semantic.id) as id,
+        1 - semantic.distance as similarity,
+        (coalesce(1.0 / (rrf_k + lexical.rank_ix), 0.0) * full_text_weight
+          + coalesce(1.0 / (rrf_k + semantic.rank_ix), 0.0) * semantic_weight)::float as score
+      from lexical
+      full outer join semantic on lexical.id = semantic.id
+      where lexical.id is not null or 1 - semantic.distance > match_threshold
+    )
+    select chat_messages.id, chat_messages.content, chat_messages.role, fused.similarity, fused.score
+    from fused
+    join chat_messages on chat_messages.id = fused.id
+    order by fused.score desc
+    limit match_count
+  );
+end;
+$$;
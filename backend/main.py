@@ -1,13 +1,59 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+from supabase import AsyncClient
 from backend.dependencies import get_current_user
-from backend.db import supabase
+from backend.db import get_async_supabase, close_async_supabase
 from backend.routers import projects, admin, chat, auth
+from backend.agents import checkpointer, llm_registry
+from backend.embeddings import check_embedding_dimensions, close_embedding_clients
+from backend import persistence
 
 load_dotenv(dotenv_path="backend/.env")
 
-app = FastAPI(title="Mainstay API via Supabase")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Wrong-size vectors would fail every insert and search against the vector(N) schema, so a
+    # mismatched embedding model stops startup. Checked first, before any pool is opened.
+    try:
+        await check_embedding_dimensions()
+    except RuntimeError:
+        await close_embedding_clients()
+        raise
+
+    # Open the pooled async data-access client up front so the first request doesn't pay for it
+    try:
+        await get_async_supabase()
+    except Exception as e:
+        print(f"Warning: Async Supabase client not initialized: {e}")
+
+    # Shared Postgres pool + LangGraph checkpointer (schema setup runs once, here)
+    try:
+        await checkpointer.open_checkpointer()
+    except Exception as e:
+        print(f"Warning: Checkpointer not initialized, chat will run stateless: {e}")
+    app.state.pg_pool = checkpointer.get_pool()
+    app.state.checkpointer = checkpointer.get_checkpointer()
+
+    # ai_models configs for the LLM client registry (reloaded lazily if this fails)
+    try:
+        await llm_registry.load_model_configs()
+    except Exception as e:
+        print(f"Warning: AI model configs not loaded: {e}")
+
+    # Background writer for chat messages (flushed before shutdown)
+    await persistence.start_persistence()
+
+    yield
+
+    await persistence.stop_persistence()
+    await checkpointer.close_checkpointer()
+    await close_embedding_clients()
+    await llm_registry.close_llm_clients()
+    await close_async_supabase()
+
+app = FastAPI(title="Mainstay API via Supabase", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,17 +70,22 @@ app.include_router(chat.router)
 app.include_router(auth.router)
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Mainstay API is running with Supabase integration"}
 
+@app.get("/health/db")
+async def db_health(user = Depends(get_current_user)):
+    """Checkpointer pool health and statistics (authenticated: the response includes pool internals)."""
+    return await checkpointer.check_health()
+
 @app.get("/me")
-def get_my_profile(user = Depends(get_current_user)):
+async def get_my_profile(user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """
     Returns the current user's profile from the 'profiles' table.
     The 'auth.users' data is available in 'user' object, but we fetch profile for application data.
     """
     try:
-        response = supabase.table("profiles").select("*").eq("id", user.id).execute()
+        response = await db.table("profiles").select("*").eq("id", user.id).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Profile not found")
         return {
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+from backend.chunking import chunk_text
+from backend.db import get_async_supabase
+from backend.embeddings import aget_embeddings, EMBEDDING_MODEL
+from backend.vector_index import vector_index
+
+# --- Write-Behind Configuration ---
+PERSIST_QUEUE_SIZE = int(os.getenv("PERSIST_QUEUE_SIZE", "10000"))
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "50"))
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "0.5"))   # seconds to gather a batch
+PERSIST_MAX_RETRIES = int(os.getenv("PERSIST_MAX_RETRIES", "3"))
+PERSIST_SHUTDOWN_TIMEOUT = float(os.getenv("PERSIST_SHUTDOWN_TIMEOUT", "30"))
+
+_queue: Optional[asyncio.Queue] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_worker_task: Optional[asyncio.Task] = None
+_stats = {"enqueued": 0, "saved": 0, "failed": 0, "dropped": 0, "chunks_saved": 0, "chunks_failed": 0}
+
+
+def enqueue_message(agent_id: str, role: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Queues a chat message for embedding + insertion into `chat_messages` in the background.
+    Safe to call from the event loop or from worker threads (e.g. sync generators).
+    Returns False if the message is empty (skipped) or the queue is not running.
+    """
+    if not content:
+        return False
+    if _queue is None or _loop is None:
+        logging.warning("Persistence queue not running; chat message not saved.")
+        return False
+
+    item = {"agent_id": agent_id, "role": role, "content": content, "metadata": metadata or {}}
+
+    def put():
+        try:
+            _queue.put_nowait(item)
+            _stats["enqueued"] += 1
+        except asyncio.QueueFull:
+            _stats["dropped"] += 1
+            logging.error("Persistence queue full; dropping chat message.")
+
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+
+    if running_loop is _loop:
+        put()
+    else:
+        _loop.call_soon_threadsafe(put)
+    return True
+
+
+async def _next_batch() -> List[Dict[str, Any]]:
+    """Waits for one item, then collects more for up to PERSIST_FLUSH_INTERVAL."""
+    batch = [await _queue.get()]
+    deadline = _loop.time() + PERSIST_FLUSH_INTERVAL
+    while len(batch) < PERSIST_BATCH_SIZE:
+        remaining = deadline - _loop.time()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(_queue.get(), timeout=remaining))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+
+async def _save_chunks(
+    saved_rows: List[Dict[str, Any]],
+    chunks: List[List[str]],
+    chunk_vectors: List[Optional[List[float]]],
+) -> None:
+    """Inserts the chunks of long messages, linked to their saved parent rows."""
+    chunk_rows = []
+    vector_iter = iter(chunk_vectors)
+    for saved, message_chunks in zip(saved_rows, chunks):
+        for chunk_index, content in enumerate(message_chunks):
+            vector = next(vector_iter)
+            if saved is None:   # parent row wasn't saved
+                continue
+            chunk_rows.append({
+                "message_id": saved["id"],
+                "agent_id": saved["agent_id"],
+                "chunk_index": chunk_index,
+                "content": content,
+                "embedding": vector,
+                # Null embeddings are left for the backfill job to retry
+                "embedding_model": EMBEDDING_MODEL if vector is not None else None,
+            })
+    if not chunk_rows:
+        return
+    try:
+        db = await get_async_supabase()
+        await db.table("chat_message_chunks").insert(chunk_rows).execute()
+        _stats["chunks_saved"] += len(chunk_rows)
+    except Exception as e:
+        _stats["chunks_failed"] += len(chunk_rows)
+        logging.error(f"Failed to save {len(chunk_rows)} chat message chunks: {e}")
+
+
+async def _save_rows_one_by_one(rows: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """Inserts rows individually after the batch insert failed; None for each row that failed."""
+    saved_rows = []
+    for row in rows:
+        try:
+            db = await get_async_supabase()
+            response = await db.table("chat_messages").insert(row).execute()
+            saved_rows.append((response.data or [None])[0])
+            _stats["saved"] += 1
+        except Exception as e:
+            saved_rows.append(None)
+            _stats["failed"] += 1
+            logging.error(f"Failed to save chat message (agent {row['agent_id']}, role {row['role']}): {e}")
+    return saved_rows
+
+
+async def _save_batch(batch: List[Dict[str, Any]]) -> None:
+    """
+    Embeds the batch (messages and the chunks of long messages) in one call and inserts all
+    rows in one request, retrying with backoff; if that keeps failing, rows are inserted one by one.
+    Rows whose embedding failed are still saved (embedding = null) so they can be backfilled.
+    """
+    # Messages that fit in one chunk are only embedded whole
+    chunks = [chunk_text(item["content"]) for item in batch]
+    chunks = [message_chunks if len(message_chunks) > 1 else [] for message_chunks in chunks]
+    texts = [item["content"] for item in batch] + [chunk for message_chunks in chunks for chunk in message_chunks]
+    all_vectors = await aget_embeddings(texts)
+    vectors, chunk_vectors = all_vectors[:len(batch)], all_vectors[len(batch):]
+
+    rows = []
+    for item, vector in zip(batch, vectors):
+        metadata = dict(item["metadata"])
+        if vector is not None:
+            metadata["embedding_model"] = EMBEDDING_MODEL
+        rows.append({**item, "embedding": vector, "metadata": metadata})
+
+    saved_rows = None
+    for attempt in range(PERSIST_MAX_RETRIES):
+        try:
+            db = await get_async_supabase()
+            response = await db.table("chat_messages").insert(rows).execute()
+            saved_rows = response.data or []
+            _stats["saved"] += len(rows)
+            break
+        except Exception as e:
+            logging.error(f"Failed to save {len(rows)} chat messages (attempt {attempt + 1}): {e}")
+            if attempt < PERSIST_MAX_RETRIES - 1:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+    if saved_rows is None:
+        # One bad row (e.g. a constraint violation) must not lose the whole batch
+        saved_rows = await _save_rows_one_by_one(rows)
+
+    # Post-insert work stays outside the retry loop: a failure here must not re-insert the rows
+    try:
+        # Keep loaded in-process indexes current without a reload
+        for saved, row in zip(saved_rows, rows):
+            if saved is not None and row["embedding"] is not None:
+                vector_index.add_message(row["agent_id"], saved["id"], row["content"], row["role"], row["embedding"])
+    except Exception as e:
+        logging.error(f"Failed to update the in-process vector index: {e}")
+    await _save_chunks(saved_rows, chunks, chunk_vectors)
+
+
+async def _worker() -> None:
+    while True:
+        batch = await _next_batch()
+        try:
+            await _save_batch(batch)
+        except Exception as e:
+            _stats["failed"] += len(batch)
+            logging.error(f"Persistence worker error: {e}")
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+async def start_persistence() -> None:
+    """Starts the background writer (called from the app lifespan)."""
+    global _queue, _loop, _worker_task
+    if _worker_task is not None:
+        return
+    _loop = asyncio.get_running_loop()
+    _queue = asyncio.Queue(maxsize=PERSIST_QUEUE_SIZE)
+    _worker_task = asyncio.create_task(_worker())
+
+
+async def stop_persistence() -> None:
+    """Flushes queued messages (bounded by PERSIST_SHUTDOWN_TIMEOUT) and stops the writer."""
+    global _queue, _loop, _worker_task
+    if _worker_task is None:
+        return
+    try:
+        await asyncio.wait_for(_queue.join(), timeout=PERSIST_SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logging.error(f"Persistence flush timed out; {_queue.qsize()} chat messages not saved.")
+    _worker_task.cancel()
+    try:
+        await _worker_task
+    except asyncio.CancelledError:
+        pass
+    _queue, _loop, _worker_task = None, None, None
+
+
+def get_persistence_stats() -> dict:
+    return {**_stats, "pending": _queue.qsize() if _queue is not None else 0}
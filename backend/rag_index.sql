@@ -0,0 +1,164 @@
+-- ANN index management + tunable search for chat_messages.
+-- Run after rag_schema.sql / fix_schema.sql. Safe to re-run.
+
+-- 1. Plain btree on agent_id (every search is filtered by agent)
+create index if not exists chat_messages_agent_id_idx on chat_messages (agent_id);
+
+-- 2. Create / rebuild the ANN index on a chat_messages embedding column
+-- USAGE: supabase.rpc('manage_chat_messages_index', { 'method': 'hnsw', 'rebuild': true })
+-- NOTE: pgvector can only index `vector` columns up to 2000 dimensions (halfvec 4000, bit 64000),
+-- so the 4096-dim `embedding` column itself cannot be indexed: the default is the reduced
+-- `embedding_short` column (embedding_compact.sql), and larger columns are rejected.
+-- An existing index built with other parameters (method, m, ef_construction, lists) is dropped
+-- and recreated; `rebuild` with the same parameters reindexes it.
+-- Index builds take a write lock on chat_messages.
+create or replace function manage_chat_messages_index (
+  index_column text default 'embedding_short',
+  method text default 'hnsw',
+  m int default 16,
+  ef_construction int default 64,
+  lists int default 100,
+  rebuild boolean default false
+)
+returns text
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  index_name text := 'chat_messages_' || index_column || '_ann_idx';
+  column_type text;
+  dims int;
+  max_dims int;
+  ops text;
+  options text[];
+  existing_method text;
+  existing_options text[];
+begin
+  if method not in ('hnsw', 'ivfflat') then
+    raise exception 'Unknown index method: %', method;
+  end if;
+
+  select format_type(a.atttypid, null), a.atttypmod into column_type, dims
+  from pg_attribute a
+  where a.attrelid = 'chat_messages'::regclass and a.attname = index_column and not a.attisdropped;
+  if column_type is null then
+    raise exception 'chat_messages has no column %', index_column;
+  end if;
+
+  ops := case column_type
+    when 'vector' then 'vector_cosine_ops'
+    when 'halfvec' then 'halfvec_cosine_ops'
+    when 'bit' then 'bit_hamming_ops'
+  end;
+  if ops is null then
+    raise exception 'Column % has unsupported type %', index_column, column_type;
+  end if;
+
+  max_dims := case column_type when 'vector' then 2000 when 'halfvec' then 4000 else 64000 end;
+  if dims is null or dims < 1 then
+    raise exception 'Column % has no fixed dimension and cannot be indexed', index_column;
+  end if;
+  if dims > max_dims then
+    raise exception 'Column % has % dimensions; % indexes support at most %', index_column, dims, column_type, max_dims;
+  end if;
+
+  options := case method
+    when 'hnsw' then array['ef_construction=' || ef_construction, 'm=' || m]
+    else array['lists=' || lists]
+  end;
+
+  select am.amname, array(select o from unnest(c.reloptions) o order by o)
+  into existing_method, existing_options
+  from pg_class c join pg_am am on am.oid = c.relam
+  where c.relname = index_name and c.relkind = 'i';
+
+  if existing_method = method and existing_options = options then
+    if not rebuild then
+      return format('%s already exists (%s)', index_name, method);
+    end if;
+    execute format('reindex index %I', index_name);
+    return format('%s rebuilt (%s)', index_name, method);
+  end if;
+
+  execute format('drop index if exists %I', index_name);
+  if method = 'hnsw' then
+    execute format(
+      'create index %I on chat_messages using hnsw (%I %s) with (m = %s, ef_construction = %s)',
+      index_name, index_column, ops, m, ef_construction
+    );
+  else
+    execute format(
+      'create index %I on chat_messages using ivfflat (%I %s) with (lists = %s)',
+      index_name, index_column, ops, lists
+    );
+  end if;
+  if existing_method is not null then
+    return format('%s recreated (%s, %s)', index_name, method, array_to_string(options, ', '));
+  end if;
+  return format('%s created (%s)', index_name, method);
+end;
+$$;
+
+revoke execute on function manage_chat_messages_index from public, anon, authenticated;
+grant execute on function manage_chat_messages_index to service_role;
+
+-- 3. Search function: nearest neighbours first (index order), threshold afterwards.
+-- The distance is computed once per candidate, and ef_search / probes can be set per query.
+-- USAGE: supabase.rpc('match_chat_messages', { 'query_embedding': [...], 'match_threshold': 0.5,
+--          'match_count': 5, 'filter_agent_id': '...', 'ef_search': 80 })
+drop function if exists match_chat_messages(vector, float, int, uuid);
+
+create or replace function match_chat_messages (
+  query_embedding vector(4096),
+  match_threshold float,
+  match_count int,
+  filter_agent_id uuid,
+  ef_search int default null,
+  probes int default null
+)
+returns table (
+  id uuid,
+  content text,
+  role text,
+  similarity float
+)
+language plpgsql
+as $$
+begin
+  -- Transaction-local, so they only affect this call
+  if ef_search is not null then
+    perform set_config('hnsw.ef_search', ef_search::text, true);
+  end if;
+  if probes is not null then
+    perform set_config('ivfflat.probes', probes::text, true);
+  end if;
+  -- pgvector >= 0.8: keep scanning the index when the agent filter removes candidates
+  begin
+    perform set_config('hnsw.iterative_scan', 'relaxed_order', true);
+  exception when others then
+    null; -- older pgvector: setting not available
+  end;
+
+  return query(
+    select
+      nearest.id,
+      nearest.content,
+      nearest.role,
+      1 - nearest.distance as similarity
+    from (
+      select
+        chat_messages.id,
+        chat_messages.content,
+        chat_messages.role,
+        chat_messages.embedding <=> query_embedding as distance
+      from chat_messages
+      where chat_messages.agent_id = filter_agent_id
+      order by chat_messages.embedding <=> query_embedding
+      limit match_count
+    ) nearest
+    where 1 - nearest.distance > match_threshold
+    order by nearest.distance
+  );
+end;
+$$;
@@ -14,13 +14,14 @@ create table if not exists chat_messages (
 
 -- Create an index for faster similarity search (IVFFlat)
 -- Note: Create this only if you have some data, but defining it tentatively is fine.
+-- Managed HNSW/IVFFlat indexes and the tunable search function live in rag_index.sql.
 -- create index on chat_messages using ivfflat (embedding vector_cosine_ops)
 -- with (lists = 100);
 
 -- Create a function to search for similar messages
 -- USAGE: supabase.rpc('match_chat_messages', { 'query_embedding': [...], 'match_threshold': 0.7, 'match_count': 5, 'filter_agent_id': '...' })
 create or replace function match_chat_messages (
-  query_embedding vector(768),
+  query_embedding vector(4096), -- must match chat_messages.embedding
   match_threshold float,
   match_count int,
   filter_agent_id uuid
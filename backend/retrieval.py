@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Dict, List, Optional
+from supabase import AsyncClient
+from backend.embeddings import aget_embedding
+from backend.vector_index import vector_index
+
+# --- RAG Configuration ---
+RAG_MATCH_COUNT = int(os.getenv("RAG_MATCH_COUNT", "5"))
+RAG_MATCH_THRESHOLD = float(os.getenv("RAG_MATCH_THRESHOLD", "0.5"))
+# Search-time ANN knobs (see rag_index.sql). Unset = server default.
+RAG_EF_SEARCH = int(os.getenv("RAG_EF_SEARCH")) if os.getenv("RAG_EF_SEARCH") else None
+RAG_PROBES = int(os.getenv("RAG_PROBES")) if os.getenv("RAG_PROBES") else None
+# Which stored representation the vector search runs on (see embedding_compact.sql):
+#   "full":   exact/ANN search on the 4096-dim embedding (match_chat_messages)
+#   "short":  truncated halfvec first pass + exact rescoring (match_chat_messages_compact)
+#   "binary": binary-quantized Hamming first pass + exact rescoring
+#   "chunks": messages + chunks of long messages, best hit per message (match_chat_message_chunks, see chunk_schema.sql)
+#   "hybrid": full-text + vector rankings fused with RRF (hybrid_search_chat_messages, see hybrid_search.sql)
+RAG_SEARCH_MODE = os.getenv("RAG_SEARCH_MODE", "full")
+# First-pass candidates per requested match for the compact modes
+RAG_CANDIDATE_FACTOR = int(os.getenv("RAG_CANDIDATE_FACTOR", "10"))
+# Hybrid mode: RRF constant and the weight of each ranking
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "50"))
+RAG_FULL_TEXT_WEIGHT = float(os.getenv("RAG_FULL_TEXT_WEIGHT", "1.0"))
+RAG_SEMANTIC_WEIGHT = float(os.getenv("RAG_SEMANTIC_WEIGHT", "1.0"))
+# "postgres": search via RPC; "memory": per-agent in-process index (see vector_index.py)
+RAG_INDEX_BACKEND = os.getenv("RAG_INDEX_BACKEND", "postgres")
+# Per-stage latency budgets. A stage that overruns is skipped (no context) instead of
+# delaying the first token.
+RAG_EMBED_BUDGET_MS = int(os.getenv("RAG_EMBED_BUDGET_MS", "400"))
+RAG_SEARCH_BUDGET_MS = int(os.getenv("RAG_SEARCH_BUDGET_MS", "400"))
+
+
+async def with_budget(stage: str, awaitable: Awaitable, budget_ms: int, shield: bool = False) -> Optional[Any]:
+    """
+    Awaits `awaitable` for at most `budget_ms`. Returns None if the budget is exceeded or it fails.
+    With shield=True the work keeps running in the background after a timeout
+    (useful for embeddings, whose result still lands in the embedding cache).
+    """
+    start = time.perf_counter()
+    task = asyncio.ensure_future(awaitable)
+    try:
+        result = await asyncio.wait_for(asyncio.shield(task) if shield else task, timeout=budget_ms / 1000)
+        logging.info(f"RAG stage '{stage}' took {(time.perf_counter() - start) * 1000:.0f}ms")
+        return result
+    except asyncio.TimeoutError:
+        logging.warning(f"RAG stage '{stage}' exceeded its {budget_ms}ms budget; skipping.")
+    except Exception as e:
+        logging.error(f"RAG stage '{stage}' failed: {e}")
+    return None
+
+
+async def search_messages(
+    db: AsyncClient,
+    query_embedding: List[float],
+    agent_id: str,
+    match_count: int = RAG_MATCH_COUNT,
+    match_threshold: float = RAG_MATCH_THRESHOLD,
+    ef_search: Optional[int] = RAG_EF_SEARCH,
+    probes: Optional[int] = RAG_PROBES,
+    search_mode: str = RAG_SEARCH_MODE,
+    query_text: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Vector search over the agent's past messages via the `match_chat_messages` RPC, or
+    `match_chat_messages_compact` for the "short"/"binary" search modes, or
+    `match_chat_message_chunks` for the "chunks" mode.
+    The "hybrid" mode also needs `query_text` and fuses full-text and vector rankings.
+    `ef_search` (HNSW) / `probes` (IVFFlat) trade recall for latency on this query only.
+    Rows have: id, content, role, similarity (+ score in hybrid mode).
+    """
+    rpc_params = {
+        "query_embedding": query_embedding,
+        "match_threshold": match_threshold,
+        "match_count": match_count,
+        "filter_agent_id": agent_id,
+    }
+    if ef_search is not None:
+        rpc_params["ef_search"] = ef_search
+
+    if search_mode == "hybrid":
+        rpc_params.update({
+            "query_text": query_text or "",
+            "full_text_weight": RAG_FULL_TEXT_WEIGHT,
+            "semantic_weight": RAG_SEMANTIC_WEIGHT,
+            "rrf_k": RAG_RRF_K,
+        })
+        response = await db.rpc("hybrid_search_chat_messages", rpc_params).execute()
+        return response.data or []
+
+    if search_mode == "chunks":
+        response = await db.rpc("match_chat_message_chunks", {
+            "query_embedding": query_embedding,
+            "match_threshold": match_threshold,
+            "match_count": match_count,
+            "filter_agent_id": agent_id,
+        }).execute()
+        return response.data or []
+
+    if search_mode != "full":
+        rpc_params.update({"search_mode": search_mode, "candidate_factor": RAG_CANDIDATE_FACTOR})
+        response = await db.rpc("match_chat_messages_compact", rpc_params).execute()
+        return response.data or []
+
+    if probes is not None:
+        rpc_params["probes"] = probes
+    response = await db.rpc("match_chat_messages", rpc_params).execute()
+    return response.data or []
+
+
+async def retrieve_context(db: AsyncClient, query: str, agent_id: str) -> List[Dict[str, Any]]:
+    """
+    Embeds the query and searches the agent's history, each stage within its budget.
+    Returns [] when any stage is skipped.
+    """
+    query_embedding = await with_budget("embedding", aget_embedding(query), RAG_EMBED_BUDGET_MS, shield=True)
+    if not query_embedding:
+        return []
+    if RAG_INDEX_BACKEND == "memory":
+        search = vector_index.search(db, agent_id, query_embedding, RAG_MATCH_COUNT, RAG_MATCH_THRESHOLD)
+    else:
+        search = search_messages(db, query_embedding, agent_id, query_text=query)
+    matches = await with_budget("search", search, RAG_SEARCH_BUDGET_MS)
+    return matches or []
+
+
+def format_context(matches: List[Dict[str, Any]]) -> str:
+    """Renders retrieved messages for the system prompt."""
+    if not matches:
+        return ""
+    lines = [f"- [{m.get('role')}] {m.get('content')}" for m in matches]
+    return "Relevant context from earlier conversations:\n" + "\n".join(lines)
@@ -1,9 +1,20 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Optional
+from typing import List, Optional, Literal
 from uuid import UUID
 from pydantic import BaseModel
-from backend.db import supabase
+from supabase import AsyncClient
+from backend.db import get_async_supabase
 from backend.dependencies import get_current_user
+from backend.agents import llm_registry
+from backend.agents.llm_cache import get_llm_cache_stats
+from backend.agents.router import get_router_stats
+from backend.agents.tool_calling import get_tool_calling_stats
+from backend.backfill import start_backfill_job, get_backfill_status
+from backend.embeddings import get_embedding_cache_stats
+from backend.entity_cache import get_entity_cache_stats
+from backend.persistence import get_persistence_stats
+from backend.vector_index import vector_index
 
 router = APIRouter(
     prefix="/admin",
@@ -31,31 +42,35 @@ class AIModelResponse(AIModelBase):
 # --- Endpoints ---
 
 @router.get("/models", response_model=List[AIModelResponse])
-def get_ai_models(user = Depends(get_current_user)):
+async def get_ai_models(user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """List all available AI models."""
     try:
-        response = supabase.table("ai_models").select("*").order("created_at").execute()
+        response = await db.table("ai_models").select("*").order("created_at").execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/models", response_model=AIModelResponse, status_code=status.HTTP_201_CREATED)
-def create_ai_model(model: AIModelCreate, user = Depends(get_current_user)):
+async def create_ai_model(model: AIModelCreate, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """Add a new AI model."""
     try:
         new_model = model.dict()
-        response = supabase.table("ai_models").insert(new_model).execute()
+        response = await db.table("ai_models").insert(new_model).execute()
         if not response.data:
             raise HTTPException(status_code=500, detail="Failed to create model")
+        llm_registry.invalidate(model.model_id)
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/models/{model_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_ai_model(model_id: UUID, user = Depends(get_current_user)):
+async def delete_ai_model(model_id: UUID, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """Delete an AI model."""
     try:
-        response = supabase.table("ai_models").delete().eq("id", str(model_id)).execute()
+        response = await db.table("ai_models").delete().eq("id", str(model_id)).execute()
+        # Drop the deleted model's cached clients (all of them if the row wasn't returned)
+        for row in response.data or [{"model_id": None}]:
+            llm_registry.invalidate(row["model_id"])
         return None
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -68,19 +83,19 @@ class UserUpdate(BaseModel):
 
 # We assume 'profiles' table has: id, email, full_name, avatar_url, role, created_at
 @router.get("/users")
-def get_users(user = Depends(get_current_user)):
+async def get_users(user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """List all users."""
     try:
-        response = supabase.table("profiles").select("*").order("created_at", desc=True).execute()
+        response = await db.table("profiles").select("*").order("created_at", desc=True).execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.patch("/users/{user_id}")
-def update_user(user_id: UUID, update: UserUpdate, user = Depends(get_current_user)):
+async def update_user(user_id: UUID, update: UserUpdate, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """Update a user's role."""
     try:
-        response = supabase.table("profiles").update(update.dict(exclude_unset=True)).eq("id", str(user_id)).execute()
+        response = await db.table("profiles").update(update.dict(exclude_unset=True)).eq("id", str(user_id)).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="User not found")
         return response.data[0]
@@ -90,17 +105,17 @@ def update_user(user_id: UUID, update: UserUpdate, user = Depends(get_current_us
 # --- System Statistics ---
 
 @router.get("/stats")
-def get_system_stats(user = Depends(get_current_user)):
+async def get_system_stats(user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """Get system-wide statistics for the dashboard."""
     try:
         # Supabase API doesn't support "count" easily in one go without 'head=True' for each.
-        # We will make parallel requests or just simple separate ones.
-        
-        users_count = supabase.table("profiles").select("*", count="exact", head=True).execute().count
-        projects_count = supabase.table("projects").select("*", count="exact", head=True).execute().count
-        agents_count = supabase.table("agents").select("*", count="exact", head=True).execute().count
-        tasks_count = supabase.table("tasks").select("*", count="exact", head=True).execute().count
-        
+        # The four count queries are independent, so run them concurrently.
+        tables = ["profiles", "projects", "agents", "tasks"]
+        results = await asyncio.gather(*[
+            db.table(table).select("*", count="exact", head=True).execute() for table in tables
+        ])
+        users_count, projects_count, agents_count, tasks_count = [r.count for r in results]
+
         return {
             "total_users": users_count,
             "total_projects": projects_count,
@@ -109,3 +124,53 @@ def get_system_stats(user = Depends(get_current_user)):
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+# --- RAG Index Management ---
+
+class RagIndexRequest(BaseModel):
+    index_column: str = "embedding_short"  # or "embedding_bin"; see embedding_compact.sql
+    method: Literal["hnsw", "ivfflat"] = "hnsw"
+    m: int = 16
+    ef_construction: int = 64
+    lists: int = 100
+    rebuild: bool = False
+
+@router.post("/rag/index")
+async def manage_rag_index(params: RagIndexRequest, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
+    """Create or rebuild the ANN index on chat_messages (see rag_index.sql)."""
+    try:
+        response = await db.rpc("manage_chat_messages_index", params.dict()).execute()
+        return {"result": response.data}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+class RagBackfillRequest(BaseModel):
+    max_rows_per_second: float = 20
+    max_rows: Optional[int] = None
+    restart: bool = False
+
+@router.post("/rag/backfill", status_code=status.HTTP_202_ACCEPTED)
+async def start_rag_backfill(params: RagBackfillRequest, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
+    """Start (or resume) re-embedding chat messages with missing or stale embeddings (see backfill.py)."""
+    if not start_backfill_job(db, **params.dict()):
+        raise HTTPException(status_code=409, detail="A backfill job is already running")
+    return get_backfill_status()
+
+@router.get("/rag/backfill")
+async def rag_backfill_status(user = Depends(get_current_user)):
+    """Progress of the current or last backfill job."""
+    return get_backfill_status()
+
+@router.get("/cache/stats")
+async def get_cache_stats(user = Depends(get_current_user)):
+    """Hit/miss counters for the in-process caches."""
+    return {
+        "embeddings": get_embedding_cache_stats(),
+        "persistence_queue": get_persistence_stats(),
+        "vector_index": vector_index.get_stats(),
+        "llm_registry": llm_registry.get_registry_stats(),
+        "entities": get_entity_cache_stats(),
+        "llm_responses": get_llm_cache_stats(),
+        "supervisor_router": get_router_stats(),
+        "tool_calling": get_tool_calling_stats()
+    }
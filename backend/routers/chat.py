@@ -1,12 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any, Generator
+from typing import List, Optional, Dict, Any, Generator, AsyncGenerator, Callable, Literal
 import requests
 import json
 import os
-from backend.db import supabase
+import asyncio
+from supabase import AsyncClient
+from backend.db import get_async_supabase
 from backend.dependencies import get_current_user
+from backend.agents.llm_registry import get_llm, load_model_configs
+from backend.entity_cache import get_agent
 
 import logging
 
@@ -33,21 +37,24 @@ class ChatRequest(BaseModel):
     message: str
     thread_id: Optional[str] = None
     history: List[ChatMessage] = []
+    # "nodes": one `data` event per finished node (legacy)
+    # "tokens": LLM tokens as they are generated, plus `route` / `tool_call` / `tool_result` events
+    stream_mode: Literal["nodes", "tokens"] = "nodes"
 
 class ChatResponse(BaseModel):
     response: str
 
-def get_model_config(model_id: str):
+async def get_model_config(model_id: str):
+    """The ai_models row for `model_id`, from the LLM registry's cached configs."""
     try:
-        response = supabase.table("ai_models").select("*").eq("model_id", model_id).execute()
-        if response.data:
-            return response.data[0]
-        return None
+        return (await load_model_configs()).get(model_id)
     except Exception as e:
         print(f"Error fetching model config: {e}")
         return None
 
-from backend.embeddings import get_embedding
+from backend.retrieval import retrieve_context, format_context
+from backend.persistence import enqueue_message
+from langchain_core.messages import AIMessageChunk
 
 # ... existing imports ...
 
@@ -96,64 +103,155 @@ def stream_llm(provider: str, model_id: str, messages: List[Dict[str, str]], api
          yield f"data: {json.dumps({'content': 'Streaming not yet supported for OpenAI/Anthropic in this demo.'})}\n\n"
     
     # --- PERSISTENCE: Save Agent Response ---
+    # Embedding + insert happen in the background writer, so the stream closes right away
     if full_response_content:
-        try:
-            logging.info("Saving Agent response to DB...")
-            embedding = get_embedding(full_response_content)
-            
-            completion_data = {
-                "agent_id": agent_id,
-                "role": "assistant",
-                "content": full_response_content,
-                "embedding": embedding,
-                "metadata": {"model": model_id}
-            }
-            supabase.table("chat_messages").insert(completion_data).execute()
-        except Exception as e:
-             logging.error(f"Failed to save agent message: {e}")
+        logging.info("Queueing Agent response for persistence...")
+        enqueue_message(agent_id, "assistant", full_response_content, {"model": model_id})
 
     yield "event: done\ndata: [DONE]\n\n"
 
+# --- Graph Streaming ---
+
+WORKER_NODES = {"Researcher", "Developer", "Reviewer"}
+
+def sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Formats one SSE message. Unnamed events are what the frontend renders as chat content."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def stream_graph_nodes(graph, inputs, config, on_message: Callable[[str, str], None]) -> AsyncGenerator[str, None]:
+    """
+    Yields one content event per finished node, as `**{node}**: {message}`.
+    `on_message(node, content)` is called for every worker message (used for persistence).
+    """
+    async for event in graph.astream(inputs, config=config):
+        for node_name, values in event.items():
+            # Nodes with nothing to update (e.g. compact when no summary is needed) yield None
+            if values and values.get("messages"):
+                last_msg = values["messages"][-1]
+                on_message(node_name, last_msg.content)
+                content = f"**{node_name}**: {last_msg.content}\n\n"
+                yield sse({"content": content, "node": node_name})
+                logging.info(f"Agent {node_name} response: {last_msg.content[:50]}...")
+
+class ToolCallFilter:
+    """
+    Drops text-protocol tool calls (`TOOL_CALL: ...`, which end a worker's response) from one
+    LLM call's streamed tokens; the calls reach clients as `tool_call` events instead.
+    A token tail that could be the start of the marker is held back until the next token.
+    """
+    MARKER = "TOOL_CALL:"
+
+    def __init__(self):
+        self.pending = ""
+        self.suppressed = False
+
+    def feed(self, text: str) -> str:
+        if self.suppressed:
+            return ""
+        text = self.pending + text
+        self.pending = ""
+        marker_at = text.find(self.MARKER)
+        if marker_at >= 0:
+            self.suppressed = True
+            return text[:marker_at]
+        for size in range(min(len(self.MARKER) - 1, len(text)), 0, -1):
+            if text.endswith(self.MARKER[:size]):
+                self.pending = text[-size:]
+                return text[:-size]
+        return text
+
+    def flush(self) -> str:
+        text, self.pending = ("" if self.suppressed else self.pending), ""
+        return text
+
+async def stream_graph_tokens(graph, inputs, config, on_message: Callable[[str, str], None]) -> AsyncGenerator[str, None]:
+    """
+    Forwards worker LLM tokens as they arrive, each tagged with its node.
+    Each LLM call of a worker's tool loop is one step: steps are separated by a blank line and
+    their tool-call text is filtered out (tool activity is sent as named events, see
+    agents/nodes.emit_event). Supervisor output is not streamed as text; its decision is sent
+    as a `route` event. `on_message(node, content)` is called for every finished worker message.
+    """
+    current_node = None
+    current_step = None        # id of the LLM call being streamed
+    step_filter = ToolCallFilter()
+    emitted = False            # whether the current node has streamed any text yet
+
+    def end_step():
+        rest = step_filter.flush()
+        return sse({"content": rest, "node": current_node}) if rest else None
+
+    async for mode, chunk in graph.astream(inputs, config=config, stream_mode=["messages", "updates", "custom"]):
+        if mode == "messages":
+            message, metadata = chunk
+            node_name = metadata.get("langgraph_node")
+            # Only LLM chunks; complete messages returned by nodes were already streamed token by token
+            if node_name not in WORKER_NODES or not isinstance(message, AIMessageChunk):
+                continue
+            if node_name != current_node or message.id != current_step:
+                rest = end_step()
+                if rest:
+                    yield rest
+                if node_name != current_node:
+                    prefix = "\n\n" if current_node else ""
+                    yield sse({"content": f"{prefix}**{node_name}**: ", "node": node_name})
+                    current_node, emitted = node_name, False
+                elif emitted:
+                    yield sse({"content": "\n\n", "node": node_name})
+                current_step, step_filter = message.id, ToolCallFilter()
+            if not message.content:
+                continue
+            text = step_filter.feed(str(message.content))
+            if text:
+                emitted = True
+                yield sse({"content": text, "node": node_name})
+
+        elif mode == "updates":
+            for node_name, values in chunk.items():
+                if node_name == "supervisor" and values and "next" in values:
+                    yield sse({"node": node_name, "next": values["next"]}, event="route")
+                elif values and values.get("messages"):
+                    if node_name == current_node:
+                        rest = end_step()
+                        if rest:
+                            yield rest
+                    on_message(node_name, values["messages"][-1].content)
+
+        elif mode == "custom":
+            yield sse(chunk, event=chunk.get("type", "custom"))
+
 @router.post("/stream")
-def chat_stream(request: ChatRequest, user = Depends(get_current_user)):
+async def chat_stream(request: ChatRequest, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """
     Stream a conversation using the Multi-Agent LangGraph.
     """
-    # 1. Fetch Agent (Optional verification)
+    # 1. Fetch Agent (entity cache) + retrieve RAG context concurrently.
+    # Retrieval stages have their own latency budgets and are skipped if they overrun.
     try:
-        agent_res = supabase.table("agents").select("*").eq("id", request.agent_id).execute()
-        if not agent_res.data:
+        agent, matches = await asyncio.gather(
+            get_agent(db, request.agent_id),
+            retrieve_context(db, request.message, request.agent_id),
+        )
+        if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
-        agent = agent_res.data[0]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB Error: {str(e)}")
 
     # 2. Prepare Inputs & Persistence
     from backend.agents.graph import get_graph
-    from langchain_core.messages import HumanMessage, SystemMessage
-    from langgraph.checkpoint.postgres import PostgresSaver
-    from psycopg_pool import ConnectionPool
-    
-    # DB Connection String (Assume standard Supabase format)
-    # Ideally use a global pool, but for now we create one per request or use a context manager if efficient
-    # Supabase connection string usually in DATABASE_URL
-    import os
-    db_uri = os.getenv("DATABASE_URL")
-    
-    # If no DB URL, warn and fall back to stateless
-    if not db_uri:
-        logging.warning("DATABASE_URL not set. Running stateless.")
-        checkpointer = None
-        graph = get_graph()
-    else:
-        # Note: PostgresSaver needs a connection info
-        # We use a context manager for the connection
-        # But `graph.stream` is an iterator. We need the connection to stay open.
-        pass # Handle inside event_stream
-
-    # ... RAG Logic (Simplified) ...
-    user_embedding = get_embedding(request.message)
-    relevant_context = ""
+    from backend.agents.checkpointer import get_checkpointer
+    from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+
+    # Shared checkpointer (pool + schema setup are created once in the app lifespan).
+    # None means DATABASE_URL is not set and we run stateless.
+    checkpointer = get_checkpointer()
+
+    relevant_context = format_context(matches)
+    if matches:
+        logging.info(f"RAG: injecting {len(matches)} matches for agent {request.agent_id}")
     
     # Build initial messages (History + Current)
     initial_messages = []
@@ -164,6 +262,8 @@ def chat_stream(request: ChatRequest, user = Depends(get_current_user)):
     
     # Add System Prompt with Agent Persona
     system_content = f"You are {agent.get('name')}. {agent.get('role')}."
+    if relevant_context:
+        system_content += f"\n\n{relevant_context}"
     initial_messages.append(SystemMessage(content=system_content))
     
     # Add History provided by client (if any)
@@ -178,48 +278,33 @@ def chat_stream(request: ChatRequest, user = Depends(get_current_user)):
     
     inputs = {"messages": initial_messages}
 
+    # Cached client for the agent's configured model (agents.model -> ai_models), passed to the nodes
+    llm = await get_llm(agent.get("model"))
+
+    # Messages are saved (and embedded) by the background writer, off the stream's path
+    thread_metadata = {"thread_id": request.thread_id} if request.thread_id else {}
+    enqueue_message(request.agent_id, "user", request.message, thread_metadata)
+
+    def save_agent_message(node_name: str, content: str):
+        enqueue_message(request.agent_id, "assistant", content, {**thread_metadata, "node": node_name})
+
     async def event_stream():
-        # Async generator to handle DB connection lifecycle
         try:
-            if db_uri and request.thread_id:
-                # Use PostgresSaver
-                # We need to setup the checkpointer
-                # Use PostgresSaver with context manager to ensure cleanup
-                try:
-                    with ConnectionPool(conninfo=db_uri, max_size=20, kwargs={"autocommit": True}) as pool:
-                        checkpointer = PostgresSaver(pool)
-                        
-                        # Ensure tables exist (Run once typically, but safe here)
-                        checkpointer.setup() 
-                        
-                        # Compile graph with checkpointer
-                        graph_with_memory = get_graph(checkpointer=checkpointer)
-                        
-                        config = {"configurable": {"thread_id": request.thread_id}}
-                        
-                        # Run with config
-                        for event in graph_with_memory.stream(inputs, config=config):
-                            for node_name, values in event.items():
-                                 if "messages" in values:
-                                    last_msg = values["messages"][-1]
-                                    content = f"**{node_name}**: {last_msg.content}"
-                                    yield f"data: {json.dumps({'content': content + '\\n\\n'})}\\n\\n"
-                                    logging.info(f"Agent {node_name} response: {last_msg.content[:50]}...")
-                    
-                except Exception as e:
-                    logging.error(f"Persistence Error: {e}")
-                    # Try to yield error if stream is still open
-                    yield f"data: {json.dumps({'error': f'Persistence Error: {str(e)}'})}\\n\\n"
-                    
+            if checkpointer and request.thread_id:
+                graph = get_graph(checkpointer=checkpointer)
+                config = {"configurable": {"thread_id": request.thread_id, "llm": llm}}
             else:
                 # Stateless Fallback
                 graph = get_graph()
-                for event in graph.stream(inputs):
-                    for node_name, values in event.items():
-                        if "messages" in values:
-                             last_msg = values["messages"][-1]
-                             content = f"**{node_name}**: {last_msg.content}"
-                             yield f"data: {json.dumps({'content': content + '\\n\\n'})}\\n\\n"
+                config = {"configurable": {"llm": llm}}
+
+            # Async path: nodes use `ainvoke` and the checkpointer is async, so the loop stays free
+            if request.stream_mode == "tokens":
+                events = stream_graph_tokens(graph, inputs, config, save_agent_message)
+            else:
+                events = stream_graph_nodes(graph, inputs, config, save_agent_message)
+            async for chunk in events:
+                yield chunk
 
             yield "event: done\ndata: [DONE]\n\n"
             
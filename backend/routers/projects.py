@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional
 from uuid import UUID
-from backend.db import supabase
+from supabase import AsyncClient
+from backend.db import get_async_supabase
 from backend.dependencies import get_current_user
+from backend.entity_cache import user_owns_project, get_project_agents, invalidate_agent, invalidate_project_agents
 from backend.schemas import ProjectCreate, ProjectResponse, ProjectUpdate, TaskCreate, TaskResponse, AgentResponse, AgentCreate
 import uuid
 
@@ -15,20 +17,20 @@ router = APIRouter(
 # --- Projects ---
 
 @router.get("/", response_model=List[ProjectResponse])
-def get_projects(user = Depends(get_current_user)):
+async def get_projects(user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """List all projects for the current user."""
     print(f"DEBUG: get_projects called for user {user.id}")
     try:
         # Fetch projects where owner_id is the current user
         print("DEBUG: Executing supabase query...")
-        response = supabase.table("projects").select("*").eq("owner_id", user.id).execute()
+        response = await db.table("projects").select("*").eq("owner_id", user.id).execute()
         print(f"DEBUG: Query result count: {len(response.data) if response.data else 0}")
         return response.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/", response_model=ProjectResponse, status_code=status.HTTP_201_CREATED)
-def create_project(project: ProjectCreate, user = Depends(get_current_user)):
+async def create_project(project: ProjectCreate, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """Create a new project."""
     new_project = {
         "title": project.title,
@@ -40,7 +42,7 @@ def create_project(project: ProjectCreate, user = Depends(get_current_user)):
     created_project = None
     
     try:
-        response = supabase.table("projects").insert(new_project).execute()
+        response = await db.table("projects").insert(new_project).execute()
         if response.data:
             created_project = response.data[0]
     except Exception as e:
@@ -55,10 +57,10 @@ def create_project(project: ProjectCreate, user = Depends(get_current_user)):
                     "full_name": user.user_metadata.get("full_name", "") if user.user_metadata else "",
                     "avatar_url": user.user_metadata.get("avatar_url", "") if user.user_metadata else ""
                 }
-                supabase.table("profiles").insert(profile_data).execute()
+                await db.table("profiles").insert(profile_data).execute()
                 
                 # Retry project creation
-                response = supabase.table("projects").insert(new_project).execute()
+                response = await db.table("projects").insert(new_project).execute()
                 if response.data:
                     created_project = response.data[0]
             except Exception as inner_e:
@@ -76,7 +78,8 @@ def create_project(project: ProjectCreate, user = Depends(get_current_user)):
         {"project_id": project_id, "name": "Alpha-PM", "role": "MANAGER", "status": "IDLE", "capabilities": ["planning", "management"], "model": "gpt-4-turbo"}
     ]
     try:
-        supabase.table("agents").insert(default_agents).execute()
+        await db.table("agents").insert(default_agents).execute()
+        invalidate_project_agents(project_id)
     except Exception as agent_e:
         print(f"Warning: Failed to seed agents: {agent_e}")
         # Non-blocking, return project anyway
@@ -84,7 +87,7 @@ def create_project(project: ProjectCreate, user = Depends(get_current_user)):
     return created_project
 
 @router.get("/{project_id}", response_model=ProjectResponse)
-def get_project(project_id: UUID, user = Depends(get_current_user)):
+async def get_project(project_id: UUID, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """Get specific project details."""
     try:
         # Debug Log Start
@@ -93,7 +96,7 @@ def get_project(project_id: UUID, user = Depends(get_current_user)):
             f.write(f"DEBUG: get_project hit. ID: {project_id}, User: {user.id}\\n")
 
         # Ensure user owns project (Naive RLS via API check, ideally RLS in DB handles this too)
-        response = supabase.table("projects").select("*").eq("id", str(project_id)).eq("owner_id", user.id).execute()
+        response = await db.table("projects").select("*").eq("id", str(project_id)).eq("owner_id", user.id).execute()
         
         if not response.data:
             with open("project_debug.log", "a") as f:
@@ -125,26 +128,24 @@ def get_project(project_id: UUID, user = Depends(get_current_user)):
 # --- Project Sub-Resources (Teams, Tasks) ---
 
 @router.get("/{project_id}/tasks", response_model=List[TaskResponse])
-def get_project_tasks(project_id: UUID, user = Depends(get_current_user)):
+async def get_project_tasks(project_id: UUID, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """List tasks for a project."""
     try:
         # Verify access
-        p_response = supabase.table("projects").select("id").eq("id", str(project_id)).eq("owner_id", user.id).execute()
-        if not p_response.data:
+        if not await user_owns_project(db, project_id, user.id):
              raise HTTPException(status_code=404, detail="Project not found")
              
-        response = supabase.table("tasks").select("*").eq("project_id", str(project_id)).execute()
+        response = await db.table("tasks").select("*").eq("project_id", str(project_id)).execute()
         return response.data
     except Exception as e:
          raise HTTPException(status_code=500, detail=str(e))
          
 @router.post("/{project_id}/tasks", response_model=TaskResponse)
-def create_project_task(project_id: UUID, task: TaskCreate, user = Depends(get_current_user)):
+async def create_project_task(project_id: UUID, task: TaskCreate, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """Create a task in a project."""
     try:
         # Verify access
-        p_response = supabase.table("projects").select("id").eq("id", str(project_id)).eq("owner_id", user.id).execute()
-        if not p_response.data:
+        if not await user_owns_project(db, project_id, user.id):
              raise HTTPException(status_code=404, detail="Project not found")
         
         new_task = {
@@ -154,7 +155,7 @@ def create_project_task(project_id: UUID, task: TaskCreate, user = Depends(get_c
             "status": task.status,
             "priority": task.priority
         }
-        response = supabase.table("tasks").insert(new_task).execute()
+        response = await db.table("tasks").insert(new_task).execute()
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -167,12 +168,12 @@ tasks_router = APIRouter(
 )
 
 @tasks_router.patch("/{task_id}", response_model=TaskResponse)
-def update_task(task_id: UUID, task_update: dict, user = Depends(get_current_user)):
+async def update_task(task_id: UUID, task_update: dict, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """Update a task's status, priority, or details."""
     try:
         # In a real app, we should check if user has access to the project this task belongs to.
         # For MVP/PoC, we assume if valid user, let them update (RLS handles security).
-        response = supabase.table("tasks").update(task_update).eq("id", str(task_id)).execute()
+        response = await db.table("tasks").update(task_update).eq("id", str(task_id)).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Task not found or update failed")
         return response.data[0]
@@ -180,10 +181,10 @@ def update_task(task_id: UUID, task_update: dict, user = Depends(get_current_use
         raise HTTPException(status_code=500, detail=str(e))
 
 @tasks_router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_task(task_id: UUID, user = Depends(get_current_user)):
+async def delete_task(task_id: UUID, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """Delete a task."""
     try:
-        response = supabase.table("tasks").delete().eq("id", str(task_id)).execute()
+        response = await db.table("tasks").delete().eq("id", str(task_id)).execute()
         # Supabase delete response data contains the deleted rows. If empty, maybe not found or RLS blocked.
         if not response.data:
              # It might be 404 or just already gone. 204 is safe.
@@ -193,10 +194,10 @@ def delete_task(task_id: UUID, user = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{project_id}/team", response_model=List[AgentResponse])
-def get_project_team(project_id: UUID, user = Depends(get_current_user)):
+async def get_project_team(project_id: UUID, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """List agents assigned to a project."""
     retries = 3
-    import time
+    import asyncio
     
     last_error = None
     for attempt in range(retries):
@@ -205,17 +206,16 @@ def get_project_team(project_id: UUID, user = Depends(get_current_user)):
                 f.write(f"DEBUG: get_project_team hit (Attempt {attempt+1}). ProjectID: {project_id}\n")
 
             # Verify access
-            p_response = supabase.table("projects").select("id").eq("id", str(project_id)).eq("owner_id", user.id).execute()
-            if not p_response.data:
+            if not await user_owns_project(db, project_id, user.id):
                  raise HTTPException(status_code=404, detail="Project not found")
                  
-            response = supabase.table("agents").select("*").eq("project_id", str(project_id)).execute()
+            team = await get_project_agents(db, project_id)
             
             # Debug Data
             with open("project_debug.log", "a") as f:
-                f.write(f"DEBUG: Team Data Count: {len(response.data)}\n")
+                f.write(f"DEBUG: Team Data Count: {len(team)}\n")
                 
-            return response.data
+            return team
             
         except HTTPException:
             raise # Don't retry 404s
@@ -225,7 +225,7 @@ def get_project_team(project_id: UUID, user = Depends(get_current_user)):
             error_str = str(e)
             if "disconnected" in error_str or "RemoteProtocolError" in error_str:
                 if attempt < retries - 1:
-                    time.sleep(0.5 * (attempt + 1))
+                    await asyncio.sleep(0.5 * (attempt + 1))
                     continue
             
             # If not retriable or out of retries, log and break
@@ -239,12 +239,11 @@ def get_project_team(project_id: UUID, user = Depends(get_current_user)):
                 raise HTTPException(status_code=500, detail=f"Database Error after retries: {str(e)}")
     
 @router.post("/{project_id}/agents", response_model=AgentResponse)
-def create_project_agent(project_id: UUID, agent: AgentCreate, user = Depends(get_current_user)):
+async def create_project_agent(project_id: UUID, agent: AgentCreate, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """Add a new agent to the project team."""
     try:
         # Verify access
-        p_response = supabase.table("projects").select("id").eq("id", str(project_id)).eq("owner_id", user.id).execute()
-        if not p_response.data:
+        if not await user_owns_project(db, project_id, user.id):
              raise HTTPException(status_code=404, detail="Project not found")
         
         new_agent = {
@@ -258,18 +257,18 @@ def create_project_agent(project_id: UUID, agent: AgentCreate, user = Depends(ge
             "autonomy_level": 3 # Default to Senior Collaborator
         }
         
-        response = supabase.table("agents").insert(new_agent).execute()
+        response = await db.table("agents").insert(new_agent).execute()
+        invalidate_project_agents(project_id)
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.patch("/{project_id}/agents/{agent_id}", response_model=AgentResponse)
-def update_project_agent(project_id: UUID, agent_id: UUID, agent_update: dict, user = Depends(get_current_user)):
+async def update_project_agent(project_id: UUID, agent_id: UUID, agent_update: dict, user = Depends(get_current_user), db: AsyncClient = Depends(get_async_supabase)):
     """Update an agent's details (role, model, goal, etc.)."""
     try:
         # Verify access
-        p_response = supabase.table("projects").select("id").eq("id", str(project_id)).eq("owner_id", user.id).execute()
-        if not p_response.data:
+        if not await user_owns_project(db, project_id, user.id):
              raise HTTPException(status_code=404, detail="Project not found")
         
         # Filter allowed fields
@@ -279,8 +278,9 @@ def update_project_agent(project_id: UUID, agent_id: UUID, agent_update: dict, u
         if not update_data:
             raise HTTPException(status_code=400, detail="No valid fields to update")
 
-        response = supabase.table("agents").update(update_data).eq("id", str(agent_id)).eq("project_id", str(project_id)).execute()
+        response = await db.table("agents").update(update_data).eq("id", str(agent_id)).eq("project_id", str(project_id)).execute()
         
+        invalidate_agent(agent_id, project_id)
         if not response.data:
             raise HTTPException(status_code=404, detail="Agent not found or update failed")
             
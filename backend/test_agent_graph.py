@@ -1,7 +1,8 @@
 from backend.agents.graph import get_graph
-from langgraph.checkpoint.postgres import PostgresSaver
-from psycopg_pool import ConnectionPool
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg_pool import AsyncConnectionPool
 from langchain_core.messages import HumanMessage
+import asyncio
 import os
 import uuid
 
@@ -11,42 +12,46 @@ if not os.getenv("DATABASE_URL"):
 
 db_uri = os.getenv("DATABASE_URL")
 
-def test_memory():
+async def run_memory_test():
     thread_id = str(uuid.uuid4())
     print(f"--- Starting Memory Test (Thread: {thread_id}) ---")
-    
+
     # Run 1: Tell name
     print("\n[Run 1] User: 'Hi, my name is Minho.'")
     inputs_1 = {"messages": [HumanMessage(content="Hi, my name is Minho.")]}
     config = {"configurable": {"thread_id": thread_id}}
-    
-    with ConnectionPool(conninfo=db_uri, kwargs={"autocommit": True}) as pool:
-        checkpointer = PostgresSaver(pool)
-        checkpointer.setup()
 
-    with ConnectionPool(conninfo=db_uri) as pool:
-        checkpointer = PostgresSaver(pool)
+    async with AsyncConnectionPool(conninfo=db_uri, kwargs={"autocommit": True, "prepare_threshold": 0}) as pool:
+        checkpointer = AsyncPostgresSaver(pool)
+        await checkpointer.setup()
+
+    async with AsyncConnectionPool(conninfo=db_uri, kwargs={"autocommit": True, "prepare_threshold": 0}) as pool:
+        checkpointer = AsyncPostgresSaver(pool)
         graph = get_graph(checkpointer=checkpointer)
-        
-        for event in graph.stream(inputs_1, config=config):
+
+        async for event in graph.astream(inputs_1, config=config):
             for node, values in event.items():
-                if "messages" in values:
+                if values and values.get("messages"):
                     print(f"[{node}]: {values['messages'][-1].content}")
 
     # Run 2: Ask name (New Graph Instance, Same Thread ID)
     print("\n[Run 2] User: 'What is my name?'")
     inputs_2 = {"messages": [HumanMessage(content="What is my name?")]}
-    
-    with ConnectionPool(conninfo=db_uri) as pool:
-        checkpointer = PostgresSaver(pool)
+
+    async with AsyncConnectionPool(conninfo=db_uri, kwargs={"autocommit": True, "prepare_threshold": 0}) as pool:
+        checkpointer = AsyncPostgresSaver(pool)
         graph = get_graph(checkpointer=checkpointer)
-        
-        for event in graph.stream(inputs_2, config=config):
+
+        async for event in graph.astream(inputs_2, config=config):
             for node, values in event.items():
-                if "messages" in values:
+                if values and values.get("messages"):
                     print(f"[{node}]: {values['messages'][-1].content}")
-                    
+
     print("\n--- Memory Test Finished ---")
 
+def test_memory():
+    # Sync entry point: pytest has no asyncio plugin configured here
+    asyncio.run(run_memory_test())
+
 if __name__ == "__main__":
     test_memory()
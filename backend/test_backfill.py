@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Memory tier only, so runs don't depend on (or pollute) the on-disk cache
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+from backend import backfill
+
+class FakeQuery:
+    """Stand-in for a PostgREST query: returns rows by id, ignoring the model filter."""
+    def __init__(self, rows):
+        self.rows = rows
+        self.last_id = None
+        self.page_size = None
+
+    def select(self, columns): return self
+    def or_(self, filters): return self
+    def order(self, column): return self
+
+    def limit(self, page_size):
+        self.page_size = page_size
+        return self
+
+    def gt(self, column, last_id):
+        self.last_id = last_id
+        return self
+
+    async def execute(self):
+        class Response:
+            data = [row for row in self.rows if self.last_id is None or row["id"] > self.last_id][:self.page_size]
+        return Response()
+
+class FakeDB:
+    def __init__(self, tables):
+        self.tables = tables
+        self.rpcs = []
+
+    def table(self, name):
+        return FakeQuery(self.tables[name])
+
+    def rpc(self, name, params):
+        self.rpcs.append((name, params))
+        return FakeQuery([])
+
+async def fake_embeddings(texts, model):
+    return [[1.0] if text != "bad" else None for text in texts]
+
+def test_backfill():
+    db = FakeDB({
+        "chat_messages": [{"id": "m1", "agent_id": "a", "content": "hello"}],
+        "chat_message_chunks": [
+            {"id": "c1", "agent_id": "a", "content": "part one"},
+            {"id": "c2", "agent_id": "b", "content": "bad"},
+        ],
+    })
+    original = backfill.aget_embeddings
+    backfill.aget_embeddings = fake_embeddings
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_path = os.path.join(directory, "checkpoint.json")
+
+            print("1. Messages, then chunks, each through its own bulk update...")
+            result = asyncio.run(backfill.run_backfill(db, model="m", checkpoint_path=checkpoint_path, max_rows_per_second=0))
+            assert [name for name, _ in db.rpcs] == ["bulk_update_chat_message_embeddings", "bulk_update_chat_message_chunk_embeddings"]
+            assert [u["id"] for u in db.rpcs[1][1]["updates"]] == ["c1"]
+            assert (result["processed"], result["updated"], result["failed"]) == (3, 2, 1), result
+            assert result["last_ids"] == {"chat_messages": "m1", "chat_message_chunks": "c2"}
+            assert result["agents"] == ["a", "b"]
+            print("SUCCESS: 2 updated, 1 failed")
+
+            print("\n2. A second run resumes from the checkpoint...")
+            db.rpcs.clear()
+            result = asyncio.run(backfill.run_backfill(db, model="m", checkpoint_path=checkpoint_path, max_rows_per_second=0))
+            assert db.rpcs == [] and result["processed"] == 3
+            print("SUCCESS: Nothing re-embedded")
+    finally:
+        backfill.aget_embeddings = original
+
+if __name__ == "__main__":
+    test_backfill()
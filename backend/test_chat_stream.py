@@ -0,0 +1,57 @@
+import asyncio
+import json
+import os
+import sys
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Memory cache tiers only, so runs don't depend on (or pollute) the on-disk caches
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+from backend.agents.graph import get_graph
+from backend.routers.chat import stream_graph_nodes, stream_graph_tokens
+
+async def collect(mode_stream, llm):
+    saved = []
+    inputs = {"messages": [HumanMessage(content="Check my login page")]}
+    config = {"configurable": {"llm": llm}}
+    events = [event async for event in mode_stream(get_graph(), inputs, config, lambda node, content: saved.append(node))]
+    return events, saved
+
+def test_stream_graph_nodes():
+    print("1. Nodes-mode stream through compact -> supervisor -> Reviewer -> FINISH...")
+    # supervisor (constrained llm router) -> Reviewer, Reviewer approves -> rules finish
+    llm = FakeListChatModel(responses=["Reviewer", "Approved. Looks good."])
+    events, saved = asyncio.run(collect(stream_graph_nodes, llm))
+    payloads = [json.loads(event.split("data: ", 1)[1]) for event in events]
+    assert [p["node"] for p in payloads] == ["Reviewer"], payloads
+    assert payloads[0]["content"].startswith("**Reviewer**: Approved.")
+    assert saved == ["Reviewer"]
+    print(f"SUCCESS: {len(events)} content event, no-op compact update skipped")
+
+def test_stream_graph_tokens():
+    print("1. Token-mode stream of a Developer turn with one tool step...")
+    llm = FakeListChatModel(responses=[
+        "Developer",
+        'Reading it first.\nTOOL_CALL: read_file {"path": "missing.py"}',
+        "The file does not exist.",
+        "FINISH",
+    ])
+    events, saved = asyncio.run(collect(stream_graph_tokens, llm))
+    content = "".join(
+        json.loads(event.split("data: ", 1)[1])["content"] for event in events if event.startswith("data: ")
+    )
+    named = [event.split("\n", 1)[0] for event in events if event.startswith("event: ")]
+    assert "TOOL_CALL" not in content, content
+    assert content == "**Developer**: Reading it first.\n\n\nThe file does not exist.", repr(content)
+    assert "event: tool_call" in named and "event: tool_result" in named, named
+    assert saved == ["Developer"]
+    print(f"SUCCESS: {content!r}")
+
+if __name__ == "__main__":
+    test_stream_graph_nodes()
+    test_stream_graph_tokens()
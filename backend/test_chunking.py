@@ -0,0 +1,28 @@
+import os
+import sys
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.chunking import chunk_text, count_tokens
+
+def test_chunk_text():
+    print("1. Short text stays in one chunk...")
+    assert chunk_text("A short answer.") == ["A short answer."]
+    assert chunk_text("   ") == []
+    print("SUCCESS")
+
+    print("\n2. Long text is split with overlap, within the token limit...")
+    paragraphs = [f"Paragraph {i}. " + " ".join(f"word{i}_{j}" for j in range(40)) for i in range(20)]
+    text = "\n\n".join(paragraphs)
+    chunks = chunk_text(text, max_tokens=120, overlap_tokens=20)
+    assert len(chunks) > 1, chunks
+    assert all(count_tokens(chunk) <= 120 for chunk in chunks), [count_tokens(c) for c in chunks]
+    # Every word survives, and consecutive chunks share text
+    joined = " ".join(chunks)
+    assert all(f"word{i}_39" in joined for i in range(20))
+    assert chunks[0].split()[-1] in chunks[1], (chunks[0][-80:], chunks[1][:80])
+    print(f"SUCCESS: {count_tokens(text)} tokens -> {len(chunks)} chunks")
+
+if __name__ == "__main__":
+    test_chunk_text()
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Memory cache tiers only, so runs don't depend on (or pollute) the on-disk caches
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from backend.agents import context
+
+def make_state():
+    messages = [SystemMessage(content="You are Alpha-PM.")]
+    for i in range(10):
+        messages.append(HumanMessage(content=f"Please read file_{i}.py"))
+        messages.append(AIMessage(content=f"Reading.\n\n[Tool Result]: {'x = 1  # line' * 400}", name="Developer"))
+    return {"messages": messages}
+
+def test_context_budget():
+    llm = FakeListChatModel(responses=["User asked to read file_0..file_7; all contained x = 1."])
+    state = make_state()
+
+    print("1. Bounded prompt stays within the budget...")
+    budget = context.get_budget(llm)
+    bounded = context.bounded_messages(state, llm)
+    total = sum(context.message_tokens(m) for m in bounded)
+    assert bounded[0].content == "You are Alpha-PM.", bounded[0]
+    assert bounded[-1] is state["messages"][-1]
+    assert total <= budget, (total, budget)
+    print(f"SUCCESS: {len(state['messages'])} messages -> {len(bounded)} ({total}/{budget} tokens)")
+
+    print("\n2. Compaction folds older turns into the rolling summary...")
+    update = asyncio.run(context.compact(state, llm))
+    assert update["summary"].startswith("User asked"), update
+    assert update["summary_upto"] == len(state["messages"]) - context.CONTEXT_KEEP_RECENT
+    state.update(update)
+    bounded = context.bounded_messages(state, llm)
+    assert "Summary of the earlier conversation" in bounded[1].content
+    assert len(bounded) <= 2 + context.CONTEXT_KEEP_RECENT
+    assert not context.needs_compaction(state, llm)
+    print(f"SUCCESS: summary_upto={state['summary_upto']}, prompt has {len(bounded)} messages")
+
+    print("\n3. An oversized newest message is shortened to the budget...")
+    huge = f"Here it is.\n\n[Tool Result]: {'y = 2  # line' * 4000}"
+    state = {"messages": [SystemMessage(content="You are Alpha-PM."), AIMessage(content=huge, name="Developer")]}
+    bounded = context.bounded_messages(state, llm)
+    total = sum(context.message_tokens(m) for m in bounded)
+    assert total <= budget, (total, budget)
+    assert bounded[-1].content.startswith("Here it is.") and "tool output truncated" in bounded[-1].content
+    state["messages"][-1] = HumanMessage(content="z " * 20000)
+    total = sum(context.message_tokens(m) for m in context.bounded_messages(state, llm))
+    assert total <= budget, (total, budget)
+    print(f"SUCCESS: {total}/{budget} tokens")
+
+    print("\n4. A tool step is fitted to the room it has...")
+    step = [AIMessage(content="Reading both."), HumanMessage(content=f"[Tool Result]: {'w = 3  # line' * 1000}"), HumanMessage(content="[Tool Result]: ok")]
+    fitted = context.fit_messages(step, 500)
+    total = sum(context.message_tokens(m) for m in fitted)
+    assert total <= 500, total
+    assert fitted[0] is step[0] and fitted[2] is step[2]
+    assert context.fit_messages(step[:1], 500) == step[:1]
+    print(f"SUCCESS: {sum(context.message_tokens(m) for m in step)} -> {total} tokens")
+
+if __name__ == "__main__":
+    test_context_budget()
@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+import time
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.cache import SQLiteCache
+
+def test_disk_cache_bounds():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = SQLiteCache(os.path.join(directory, "cache.sqlite"), maxsize=3, ttl=60, purge_every=1)
+
+        print("1. Batched reads and writes...")
+        cache.set_many([("a", b"1"), ("b", b"2"), ("c", b"3")])
+        time.sleep(0.01)
+        assert cache.get_many(["a", "b", "missing"]) == {"a": b"1", "b": b"2"}
+        print("SUCCESS: 2 hits, 1 miss")
+
+        print("\n2. Rows above maxsize are evicted, least recently read first...")
+        time.sleep(0.01)
+        cache.get("a")
+        cache.set("d", b"4")
+        assert len(cache) == 3
+        assert cache.get("a") == b"1" and cache.get("d") == b"4"
+        assert cache.get("c") is None
+        print("SUCCESS: Size stays at 3")
+
+        print("\n3. Expired rows are not returned and get purged...")
+        cache.set("old", b"5", expires_at=time.time() - 1)
+        assert cache.get("old") is None
+        assert "old" not in cache.get_many(["old"]) and len(cache) <= 3
+        print("SUCCESS: Expired row gone")
+
+if __name__ == "__main__":
+    test_disk_cache_bounds()
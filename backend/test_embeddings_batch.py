@@ -0,0 +1,80 @@
+
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Memory tier only, so runs don't depend on (or pollute) the on-disk cache
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+from backend import embeddings
+
+# Requests received by the stand-in server (one list of inputs per call)
+received_batches = []
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for Ollama's /api/embed: the vector for a text is [len(text), 1.0].
+    Any batch containing "FAIL" is rejected, like Ollama does for a bad input.
+    """
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        inputs = body["input"]
+        received_batches.append(inputs)
+
+        if self.path != "/api/embed" or any("FAIL" in text for text in inputs):
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        payload = json.dumps({"embeddings": [[float(len(text)), 1.0] for text in inputs]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+def start_fake_ollama():
+    server = HTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    embeddings.OLLAMA_BASE_URL = f"http://127.0.0.1:{server.server_port}"
+    return server
+
+def test_batch_embeddings():
+    # The module may already be imported (e.g. under pytest) with the disk tier enabled
+    embeddings._disk_cache = None
+    embeddings._memory_cache.clear()
+    server = start_fake_ollama()
+    dimensions = embeddings.EMBEDDING_DIMENSIONS
+    try:
+        embeddings.EMBEDDING_DIMENSIONS = 2   # the stand-in makes 2-dim vectors
+        embeddings.EMBEDDING_BATCH_SIZE = 2
+        texts = ["a", "bb", "a", "FAIL here", "cccc"]
+
+        print("1. Embedding a batch with one duplicate and one failing item...")
+        vectors = embeddings.get_embeddings(texts)
+        assert vectors[0] == [1.0, 1.0] and vectors[2] == [1.0, 1.0], vectors
+        assert vectors[1] == [2.0, 1.0], vectors
+        assert vectors[3] is None, vectors
+        assert vectors[4] == [4.0, 1.0], vectors
+        assert sum(batch.count("a") for batch in received_batches) == 1, received_batches
+        print(f"SUCCESS: Order kept, failure isolated. Requests sent: {received_batches}")
+
+        print("\n2. Re-embedding the same texts should hit the cache...")
+        received_batches.clear()
+        embeddings.get_embeddings(["a", "bb", "cccc"])
+        assert received_batches == [], received_batches
+        print(f"SUCCESS: No requests sent. Cache stats: {embeddings.get_embedding_cache_stats()}")
+    finally:
+        embeddings.EMBEDDING_DIMENSIONS = dimensions
+        server.shutdown()
+
+if __name__ == "__main__":
+    test_batch_embeddings()
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+import threading
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Memory tier only, so runs don't depend on (or pollute) the on-disk cache
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+from backend import embeddings
+
+class CountingLocalClient(embeddings.LocalEmbeddingClient):
+    """
+    Local provider with the ONNX model swapped for a stand-in (vector = [len(text), 1.0]),
+    recording the micro-batches it runs. "FAIL" inputs fail their whole batch.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    def _encode(self, model, texts):
+        assert threading.current_thread() is not threading.main_thread()
+        self.batches.append(texts)
+        if any("FAIL" in text for text in texts):
+            raise ValueError("bad input")
+        return [[float(len(text)), 1.0] for text in texts]
+
+async def run_micro_batching():
+    client = CountingLocalClient(max_batch_size=8, max_wait_ms=20)
+    dimensions = embeddings.EMBEDDING_DIMENSIONS
+    try:
+        embeddings.EMBEDDING_DIMENSIONS = 2   # the stand-in makes 2-dim vectors
+        print("1. Concurrent single-text callers should share one micro-batch...")
+        texts = [f"text {'x' * i}" for i in range(6)]
+        vectors = await asyncio.gather(*[client.embed([text], "test-model") for text in texts])
+        assert [v[0] for v in vectors] == [[float(len(t)), 1.0] for t in texts], vectors
+        assert len(client.batches) == 1, client.batches
+        print(f"SUCCESS: {len(texts)} callers -> {len(client.batches)} batch")
+
+        print("\n2. A failing input fails its batch; aget_embeddings retries items individually...")
+        results = await embeddings.aget_embeddings(["ok one", "FAIL", "ok two"], "test-model", client=client)
+        assert results[0] == [6.0, 1.0] and results[1] is None and results[2] == [6.0, 1.0], results
+        print("SUCCESS: Failure isolated")
+
+        print("\n3. Vectors that don't match the schema's dimension are discarded, and startup refuses them...")
+        embeddings.EMBEDDING_DIMENSIONS = 384
+        results = await embeddings.aget_embeddings(["wrong size"], "test-model", client=client)
+        assert results == [None], results
+        original_client = embeddings.get_embedding_client
+        embeddings.get_embedding_client = lambda base_url=None: client
+        try:
+            await embeddings.check_embedding_dimensions()
+            raise AssertionError("dimension mismatch not detected")
+        except RuntimeError as e:
+            assert "schema expects 384" in str(e), e
+        finally:
+            embeddings.get_embedding_client = original_client
+        print("SUCCESS: Mismatch rejected")
+    finally:
+        embeddings.EMBEDDING_DIMENSIONS = dimensions
+        await client.aclose()
+
+def test_local_micro_batching():
+    asyncio.run(run_micro_batching())
+
+if __name__ == "__main__":
+    test_local_micro_batching()
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import sys
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Memory tier only, so runs don't depend on (or pollute) the on-disk cache
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+from backend import persistence
+
+class FakeTable:
+    """
+    Stand-in for a Supabase table: records inserted row batches.
+    The first `fail_times` inserts fail, and so does any insert containing a row with `bad` content.
+    """
+    def __init__(self, db):
+        self.db = db
+
+    def insert(self, rows):
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    async def execute(self):
+        self.db.attempts += 1
+        if self.db.fail_times > 0:
+            self.db.fail_times -= 1
+            raise RuntimeError("connection reset")
+        if any(row["content"] == self.db.bad for row in self.rows):
+            raise RuntimeError("invalid row")
+        self.db.inserts.append(self.rows)
+        class Response:
+            data = [{**row, "id": i} for i, row in enumerate(self.rows)]
+        return Response()
+
+class FakeDB:
+    def __init__(self, fail_times=0, bad=None):
+        self.inserts = []
+        self.attempts = 0
+        self.fail_times = fail_times
+        self.bad = bad
+
+    def table(self, name):
+        return FakeTable(self)
+
+async def fake_embeddings(texts):
+    return [[1.0, 0.0] for _ in texts]
+
+def failing_add_message(*args):
+    raise RuntimeError("index update failed")
+
+def message(content):
+    return {"agent_id": "agent", "role": "user", "content": content, "metadata": {}}
+
+def test_persistence():
+    db = FakeDB()
+
+    async def get_db():
+        return db
+
+    originals = (persistence.get_async_supabase, persistence.aget_embeddings, persistence.PERSIST_MAX_RETRIES)
+    persistence.get_async_supabase = get_db
+    persistence.aget_embeddings = fake_embeddings
+    persistence.PERSIST_MAX_RETRIES = 2
+    persistence.vector_index.add_message = failing_add_message
+    try:
+        print("1. Empty messages are skipped quietly...")
+        assert persistence.enqueue_message("agent", "assistant", "") is False
+        print("SUCCESS: Skipped")
+
+        print("\n2. A failure after the insert does not re-insert the rows...")
+        saved_before = persistence.get_persistence_stats()["saved"]
+        asyncio.run(persistence._save_batch([message("hello")]))
+        assert len(db.inserts) == 1, db.inserts
+        assert persistence.get_persistence_stats()["saved"] == saved_before + 1
+        print("SUCCESS: Inserted once")
+        del persistence.vector_index.add_message   # back to the class method
+
+        print("\n3. A failed insert is retried...")
+        db = FakeDB(fail_times=1)
+        asyncio.run(persistence._save_batch([message("a"), message("b")]))
+        assert db.attempts == 2 and [len(rows) for rows in db.inserts] == [2], db.inserts
+        print("SUCCESS: Saved on the second attempt")
+
+        print("\n4. When every attempt fails, rows are saved one by one...")
+        db = FakeDB(bad="bad")
+        stats_before = persistence.get_persistence_stats()
+        asyncio.run(persistence._save_batch([message("a"), message("bad"), message("c")]))
+        assert [[row["content"] for row in rows] for rows in db.inserts] == [["a"], ["c"]], db.inserts
+        stats = persistence.get_persistence_stats()
+        assert stats["saved"] == stats_before["saved"] + 2 and stats["failed"] == stats_before["failed"] + 1, stats
+        print("SUCCESS: Only the bad row was lost")
+
+        print("\n5. Queued messages are batched and flushed on shutdown...")
+        db = FakeDB()
+
+        async def run_queue():
+            await persistence.start_persistence()
+            for i in range(5):
+                assert persistence.enqueue_message("agent", "user", f"message {i}")
+            await persistence.stop_persistence()
+
+        asyncio.run(run_queue())
+        assert [len(rows) for rows in db.inserts] == [5], db.inserts
+        assert persistence.get_persistence_stats()["pending"] == 0
+        print("SUCCESS: One insert for the batch, nothing left queued")
+    finally:
+        persistence.get_async_supabase, persistence.aget_embeddings, persistence.PERSIST_MAX_RETRIES = originals
+        persistence.vector_index.__dict__.pop("add_message", None)   # back to the class method
+
+if __name__ == "__main__":
+    test_persistence()
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Memory cache tiers only, so runs don't depend on (or pollute) the on-disk caches
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, AIMessage
+from backend.agents import router
+
+async def run_router():
+    print("1. Rules decide without calling the LLM...")
+    llm = FakeListChatModel(responses=["Developer"])
+    approved = [HumanMessage(content="Add a login page"), AIMessage(content="Looks good. Approved.", name="Reviewer")]
+    assert await router.route(approved, llm, ["rules", "llm"]) == "FINISH"
+    assert llm.i == 0, "LLM should not have been called"
+    print("SUCCESS: Reviewer approval -> FINISH")
+
+    print("\n2. Without a rule match, the constrained LLM router decides...")
+    start = [HumanMessage(content="Add a login page")]
+    assert await router.route(start, llm, ["rules", "llm"]) == "Developer"
+    print("SUCCESS: llm -> Developer")
+
+    print("\n3. Unparseable output falls through to the next strategy...")
+    llm = FakeListChatModel(responses=["<think>", "Researcher"])
+    assert await router.route(start, llm, ["llm", "full"]) == "Researcher"
+    print(f"SUCCESS: Stats {router.get_router_stats()['stats']}")
+
+    print("\n4. A Reviewer reply that isn't an approval doesn't finish the run...")
+    for reply in ["Not approved: the form has no validation.", "This cannot be approved yet.", "Unapproved changes remain."]:
+        messages = [HumanMessage(content="Add a login page"), AIMessage(content=reply, name="Reviewer")]
+        assert await router.route_rules(messages, llm) is None, reply
+    print("SUCCESS: Negated verdicts ignored")
+
+    print("\n5. When every strategy fails, the run ends but is counted as a failure...")
+    class BrokenLLM:
+        async def ainvoke(self, *args, **kwargs):
+            raise ConnectionError("endpoint down")
+    failed_before = router.get_router_stats()["all_failed"]
+    assert await router.route(start, BrokenLLM(), ["llm", "full"]) == "FINISH"
+    assert router.get_router_stats()["all_failed"] == failed_before + 1
+    print("SUCCESS: Counted in all_failed")
+
+def test_supervisor_router():
+    assert router.parse_route("'Reviewer'.") == "Reviewer"
+    assert router.parse_route("write the code") == "Developer"
+    assert router.parse_route("hmm") is None
+    assert router.is_approval("Looks good. Approved.") and router.is_approval("Verdict: **Approved**")
+    asyncio.run(run_router())
+
+if __name__ == "__main__":
+    test_supervisor_router()
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import sys
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Memory cache tiers only, so runs don't depend on (or pollute) the on-disk caches
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from backend.agents import nodes, tool_calling
+
+class FakeToolModel(FakeMessagesListChatModel):
+    """Fake model with tool support that records the messages of each call."""
+    calls: list = []
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        self.calls.append(messages)
+        return await super().ainvoke(messages, *args, **kwargs)
+
+class FakeReadFile:
+    async def ainvoke(self, args):
+        return f"contents of {args['path']}"
+
+def run_loop(llm):
+    state = {"messages": [HumanMessage(content="Read a.py and b.py")]}
+    return asyncio.run(nodes.run_react_loop(
+        "Developer", "- read_file(path)", {"read_file": FakeReadFile()}, state, {"configurable": {"llm": llm}}
+    ))
+
+def test_tool_calling():
+    print("1. Native tool calls, answered with one ToolMessage per call id...")
+    llm = FakeToolModel(responses=[
+        AIMessage(content="", tool_calls=[
+            {"name": "read_file", "args": {"path": "a.py"}, "id": "call_1"},
+            {"name": "read_file", "args": {"path": "b.py"}, "id": "call_2"},
+        ]),
+        AIMessage(content="Both files read."),
+    ])
+    message = run_loop(llm)
+    tool_messages = [m for m in llm.calls[1] if isinstance(m, ToolMessage)]
+    assert [m.tool_call_id for m in tool_messages] == ["call_1", "call_2"]
+    assert tool_messages[1].content == "[Tool Result]: contents of b.py"
+    assert message.content.startswith("Both files read.")
+    assert 'TOOL_CALL: read_file {"path": "a.py"}' in message.content, message.content
+    print("SUCCESS: 2 native calls in one step")
+
+    print("\n2. JSON mode: tool calls, answer and invalid output...")
+    response = AIMessage(content='{"tool_calls": [{"name": "read_file", "args": {"path": "a.py"}}, {"args": {}}]}')
+    text, calls = tool_calling.extract_tool_calls(response, "json")
+    assert calls[0] == ("read_file", {"path": "a.py"}) and calls[1][1].startswith("Error: invalid tool call")
+    text, calls = tool_calling.extract_tool_calls(AIMessage(content='{"answer": "Done."}'), "json")
+    assert (text, calls) == ("Done.", [])
+    text, calls = tool_calling.extract_tool_calls(AIMessage(content='TOOL_CALL: read_file {"path": "a.py"}'), "json")
+    assert calls == [("read_file", {"path": "a.py"})]
+    print("SUCCESS: Parsed, with the text protocol as fallback")
+
+    print("\n3. Parse failures are counted per mode...")
+    json_stats = tool_calling.get_tool_calling_stats()["stats"]["json"]
+    assert json_stats["responses"] == 3 and json_stats["failed_responses"] == 2, json_stats
+    assert json_stats["parse_failure_rate"] == round(2 / 3, 4)
+    assert tool_calling.get_tool_calling_stats()["stats"]["native"]["parse_failures"] == 0
+    print(f"SUCCESS: {json_stats}")
+
+if __name__ == "__main__":
+    test_tool_calling()
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import sys
+import time
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Memory cache tiers only, so runs don't depend on (or pollute) the on-disk caches
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+
+from backend.agents import nodes
+
+class SlowTool:
+    """Stand-in tool that sleeps, recording the order calls started in."""
+    def __init__(self, delay):
+        self.delay = delay
+        self.started = []
+
+    async def ainvoke(self, args):
+        self.started.append(args["path"])
+        await asyncio.sleep(self.delay)
+        return f"contents of {args['path']}"
+
+def test_tool_calls():
+    print("1. Parsing several calls, including multi-line JSON...")
+    calls = nodes.parse_tool_calls(
+        'Reading both.\nTOOL_CALL: read_file {"path": "a.py"}\nTOOL_CALL: read_file {\n  "path": "b.py"\n}\nTOOL_CALL: read_file {bad'
+    )
+    assert [c[0] for c in calls] == ["read_file"] * 3
+    assert calls[0][1] == {"path": "a.py"} and calls[1][1] == {"path": "b.py"}
+    assert calls[2][1].startswith("Error: invalid arguments")
+    print("SUCCESS: 3 calls parsed, bad JSON reported per call")
+
+    print("\n2. Independent calls run concurrently, results in call order...")
+    tool = SlowTool(0.2)
+    content = "\n".join(f'TOOL_CALL: read_file {{"path": "{p}"}}' for p in ["a.py", "b.py", "c.py"])
+    start = time.perf_counter()
+    result = asyncio.run(nodes.run_tool_from_response(content + "\nTOOL_CALL: missing {}", {"read_file": tool}))
+    elapsed = time.perf_counter() - start
+    assert elapsed < 0.5, elapsed
+    assert result.index("(1) read_file") < result.index("contents of a.py") < result.index("(3) read_file") < result.index("contents of c.py")
+    assert "(4) missing {}\nError: Tool missing not found." in result, result
+    print(f"SUCCESS: 3 calls in {elapsed:.2f}s")
+
+    print("\n3. A single call returns its result unchanged; timeouts are per call...")
+    nodes.TOOL_TIMEOUTS["read_file"] = 0.05
+    try:
+        result = asyncio.run(nodes.run_tool_from_response('TOOL_CALL: read_file {"path": "a.py"}', {"read_file": tool}))
+    finally:
+        nodes.TOOL_TIMEOUTS.pop("read_file")
+    assert result.startswith("Error: read_file timed out after 0.05s (it may still complete"), result
+    print("SUCCESS: Timed out")
+
+    print("\n4. A write in the batch makes the calls run one at a time, in order, without a timeout...")
+    tool = SlowTool(0.1)
+    content = 'TOOL_CALL: write_file {"path": "a.py"}\nTOOL_CALL: read_file {"path": "a.py"}'
+    start = time.perf_counter()
+    nodes.TOOL_TIMEOUTS["write_file"] = 0.05
+    try:
+        result = asyncio.run(nodes.run_tool_from_response(content, {"read_file": tool, "write_file": tool}))
+    finally:
+        nodes.TOOL_TIMEOUTS.pop("write_file")
+    assert tool.started == ["a.py", "a.py"] and time.perf_counter() - start >= 0.2
+    assert "timed out" not in result, result
+    print("SUCCESS: Sequential, write waited for")
+
+if __name__ == "__main__":
+    test_tool_calls()
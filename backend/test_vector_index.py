@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sys
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.vector_index import AgentIndex, VectorIndexCache
+
+def test_agent_index_search():
+    print("1. Searching a small in-memory index...")
+    index = AgentIndex(capacity=2)   # small capacity to exercise growth
+    index.append("a", "north", "user", [1.0, 0.0])
+    index.append("b", "north-east", "user", "[0.7,0.7]")   # PostgREST string form
+    index.append("c", "east", "assistant", [0.0, 1.0])
+    index.append("d", "south", "assistant", [-1.0, 0.0])
+    assert not index.append("e", "wrong dim", "user", [1.0, 0.0, 0.0])
+    assert not index.append("f", "zero", "user", [0.0, 0.0])
+    assert index.size == 4, index.size
+
+    matches = index.search([2.0, 0.0], match_count=3, match_threshold=0.5)
+    assert [m["id"] for m in matches] == ["a", "b"], matches
+    assert abs(matches[0]["similarity"] - 1.0) < 1e-6, matches
+    print(f"SUCCESS: Top matches {[(m['id'], round(m['similarity'], 3)) for m in matches]}")
+
+def test_cache_eviction():
+    print("\n2. Evicting least recently used agents over the memory cap...")
+    cache = VectorIndexCache(max_bytes=1)
+    for agent_id in ("agent-1", "agent-2"):
+        index = AgentIndex()
+        index.append("m", "hello", "user", [1.0, 0.0])
+        cache._indexes[agent_id] = index
+        cache._evict()
+    assert list(cache._indexes) == ["agent-2"], list(cache._indexes)
+
+    cache.add_message("agent-2", "n", "again", "user", [0.0, 1.0])
+    cache.add_message("agent-3", "x", "not loaded", "user", [0.0, 1.0])
+    stats = cache.get_stats()
+    assert stats["agents"] == 1 and stats["messages"] == 2 and stats["evictions"] == 1, stats
+    print(f"SUCCESS: Stats {stats}")
+
+class FakeQuery:
+    """Stand-in for a chat_messages query: every call chains, execute waits for `release`."""
+    def __init__(self, rows, release):
+        self.rows = rows
+        self.release = release
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    @property
+    def not_(self):
+        return self
+
+    async def execute(self):
+        await self.release.wait()
+        class Response:
+            data = self.rows
+        return Response()
+
+class FakeDB:
+    def __init__(self, rows, release):
+        self.rows = rows
+        self.release = release
+
+    def table(self, name):
+        return FakeQuery(self.rows, self.release)
+
+def test_add_during_load():
+    print("\n3. Messages saved while an index loads are added once it is stored...")
+
+    async def run():
+        release = asyncio.Event()
+        db = FakeDB([{"id": "a", "content": "north", "role": "user", "embedding": "[1.0,0.0]"}], release)
+        cache = VectorIndexCache()
+        loading = asyncio.ensure_future(cache.get(db, "agent-1"))
+        await asyncio.sleep(0)
+        cache.add_message("agent-1", "a", "north", "user", [1.0, 0.0])   # also read by the load
+        cache.add_message("agent-1", "b", "east", "assistant", [0.0, 1.0])
+        release.set()
+        return await loading
+
+    index = asyncio.run(run())
+    assert [row["id"] for row in index.rows] == ["a", "b"], index.rows
+    print(f"SUCCESS: {index.size} messages, no duplicates")
+
+if __name__ == "__main__":
+    test_agent_index_search()
+    test_cache_eviction()
+    test_add_during_load()
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sys
+
+# Ensure backend directory is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Memory cache tiers only, so runs don't depend on (or pollute) the on-disk caches
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+from backend.agents import nodes
+
+class FakeReadFile:
+    """Stand-in for the read_file tool, recording the paths it was asked for."""
+    def __init__(self):
+        self.paths = []
+
+    async def ainvoke(self, args):
+        self.paths.append(args["path"])
+        return f"contents of {args['path']}"
+
+async def run_loop(responses, max_steps=5):
+    tool = FakeReadFile()
+    llm = FakeListChatModel(responses=responses)
+    state = {"messages": [HumanMessage(content="Read a.py and b.py")]}
+    default_steps = nodes.WORKER_MAX_STEPS
+    nodes.WORKER_MAX_STEPS = max_steps
+    try:
+        message = await nodes.run_react_loop("Developer", "prompt", {"read_file": tool}, state, {"configurable": {"llm": llm}})
+    finally:
+        nodes.WORKER_MAX_STEPS = default_steps
+    return message, tool
+
+def test_worker_loop():
+    print("1. Several tool calls in one worker turn...")
+    message, tool = asyncio.run(run_loop([
+        'TOOL_CALL: read_file {"path": "a.py"}',
+        'TOOL_CALL: read_file {"path": "b.py"}',
+        "Both files read.",
+    ]))
+    assert tool.paths == ["a.py", "b.py"], tool.paths
+    assert message.content.startswith("Both files read."), message.content
+    assert "[Tool Result]: contents of b.py" in message.content
+    print("SUCCESS: Final answer first, both tool results kept")
+
+    print("\n2. The step limit stops a worker that keeps calling tools...")
+    message, tool = asyncio.run(run_loop(['TOOL_CALL: read_file {"path": "a.py"}'] * 3, max_steps=2))
+    assert tool.paths == ["a.py", "a.py"], tool.paths
+    assert message.content.startswith("(Stopped after 2 tool steps"), message.content
+    print("SUCCESS: Stopped after 2 steps")
+
+if __name__ == "__main__":
+    test_worker_loop()
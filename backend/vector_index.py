@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import numpy as np
+from supabase import AsyncClient
+
+# --- In-Process Vector Index ---
+# One normalized float32 matrix per agent, loaded lazily from chat_messages and kept
+# up to date as messages are saved. Searches are a single matrix-vector product.
+VECTOR_INDEX_MAX_BYTES = int(os.getenv("VECTOR_INDEX_MAX_BYTES", str(512 * 1024 * 1024)))
+VECTOR_INDEX_PAGE_SIZE = int(os.getenv("VECTOR_INDEX_PAGE_SIZE", "500"))
+
+
+def _to_array(embedding: Any) -> Optional[np.ndarray]:
+    """pgvector values come back from PostgREST as '[0.1,0.2,...]' strings."""
+    if embedding is None:
+        return None
+    if isinstance(embedding, str):
+        embedding = json.loads(embedding)
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def _normalize(vector: np.ndarray) -> Optional[np.ndarray]:
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return None
+    return vector / norm
+
+
+class AgentIndex:
+    """
+    Vectors of one agent's messages. Rows are stored unit-length, so cosine similarity is a dot product.
+    Capacity grows geometrically, so appends are amortized O(d). The dimension is taken
+    from the first vector appended.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.dim: Optional[int] = None
+        self.size = 0
+        self._capacity = capacity
+        self._matrix: Optional[np.ndarray] = None
+        self.rows: List[Dict[str, Any]] = []   # id, content, role per matrix row
+
+    @property
+    def nbytes(self) -> int:
+        return self._matrix.nbytes if self._matrix is not None else 0
+
+    def append(self, message_id: str, content: str, role: str, embedding: Any) -> bool:
+        vector = _to_array(embedding)
+        if vector is None or (self.dim is not None and vector.shape[0] != self.dim):
+            return False
+        vector = _normalize(vector)
+        if vector is None:
+            return False
+
+        if self._matrix is None:
+            self.dim = vector.shape[0]
+            self._matrix = np.empty((self._capacity, self.dim), dtype=np.float32)
+        elif self.size == self._matrix.shape[0]:
+            grown = np.empty((self._matrix.shape[0] * 2, self.dim), dtype=np.float32)
+            grown[:self.size] = self._matrix[:self.size]
+            self._matrix = grown
+        self._matrix[self.size] = vector
+        self.rows.append({"id": message_id, "content": content, "role": role})
+        self.size += 1
+        return True
+
+    def search(self, query_embedding: Any, match_count: int, match_threshold: float) -> List[Dict[str, Any]]:
+        """
+        Same contract as the match_chat_messages RPC: top `match_count` by cosine similarity,
+        keeping only similarity > match_threshold, best first.
+        """
+        query = _to_array(query_embedding)
+        if self.size == 0 or query is None or query.shape[0] != self.dim:
+            return []
+        query = _normalize(query)
+        if query is None:
+            return []
+
+        similarities = self._matrix[:self.size] @ query
+        k = min(match_count, self.size)
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [
+            {**self.rows[i], "similarity": float(similarities[i])}
+            for i in top
+            if similarities[i] > match_threshold
+        ]
+
+
+class VectorIndexCache:
+    """
+    Per-agent indexes with LRU eviction under a total memory cap.
+    """
+
+    def __init__(self, max_bytes: int = VECTOR_INDEX_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._indexes: "OrderedDict[str, AgentIndex]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+        # Messages saved while their agent's index is loading, applied once it is stored
+        self._pending: Dict[str, List[tuple]] = {}
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0}
+
+    async def _load(self, db: AsyncClient, agent_id: str) -> AgentIndex:
+        """Pages through the agent's embedded messages (keyset on id)."""
+        index = AgentIndex()
+        last_id = None
+        while True:
+            query = (
+                db.table("chat_messages")
+                .select("id, content, role, embedding")
+                .eq("agent_id", agent_id)
+                .not_.is_("embedding", "null")
+                .order("id")
+                .limit(VECTOR_INDEX_PAGE_SIZE)
+            )
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            rows = (await query.execute()).data or []
+            # Parsing a page of '[...]' strings is CPU-bound; keep it off the event loop
+            vectors = await asyncio.to_thread(lambda: [_to_array(row["embedding"]) for row in rows])
+            for row, vector in zip(rows, vectors):
+                index.append(row["id"], row["content"], row["role"], vector)
+            if len(rows) < VECTOR_INDEX_PAGE_SIZE:
+                break
+            last_id = rows[-1]["id"]
+
+        self.stats["loads"] += 1
+        logging.info(f"Vector index loaded for agent {agent_id}: {index.size} messages")
+        return index
+
+    async def get(self, db: AsyncClient, agent_id: str) -> AgentIndex:
+        index = self._indexes.get(agent_id)
+        if index is not None:
+            self._indexes.move_to_end(agent_id)
+            self.stats["hits"] += 1
+            return index
+
+        # Concurrent requests for the same agent share one load. The load is shielded, so
+        # a caller that gives up (latency budget) still leaves a warm index behind.
+        task = self._loading.get(agent_id)
+        if task is None:
+            self._pending[agent_id] = []
+            task = self._loading[agent_id] = asyncio.ensure_future(self._load_and_store(db, agent_id))
+        return await asyncio.shield(task)
+
+    async def _load_and_store(self, db: AsyncClient, agent_id: str) -> AgentIndex:
+        try:
+            index = await self._load(db, agent_id)
+        finally:
+            self._loading.pop(agent_id, None)
+            pending = self._pending.pop(agent_id, [])
+        # The load may already have read some of the messages saved meanwhile
+        loaded_ids = {row["id"] for row in index.rows}
+        for message in pending:
+            if message[0] not in loaded_ids:
+                index.append(*message)
+        self._indexes[agent_id] = index
+        self._evict()
+        return index
+
+    def add_message(self, agent_id: str, message_id: str, content: str, role: str, embedding: Any) -> None:
+        """
+        Appends a newly saved message if the agent's index is loaded or loading (otherwise it
+        loads on demand).
+        """
+        if agent_id in self._pending:
+            self._pending[agent_id].append((message_id, content, role, embedding))
+            return
+        index = self._indexes.get(agent_id)
+        if index is not None and index.append(message_id, content, role, embedding):
+            self._evict()
+
+    def invalidate(self, agent_id: str) -> None:
+        self._indexes.pop(agent_id, None)
+
+    def _evict(self) -> None:
+        total = sum(index.nbytes for index in self._indexes.values())
+        while total > self.max_bytes and len(self._indexes) > 1:
+            _, evicted = self._indexes.popitem(last=False)
+            total -= evicted.nbytes
+            self.stats["evictions"] += 1
+
+    async def search(
+        self,
+        db: AsyncClient,
+        agent_id: str,
+        query_embedding: List[float],
+        match_count: int,
+        match_threshold: float,
+    ) -> List[Dict[str, Any]]:
+        index = await self.get(db, agent_id)
+        return index.search(query_embedding, match_count, match_threshold)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "agents": len(self._indexes),
+            "messages": sum(index.size for index in self._indexes.values()),
+            "bytes": sum(index.nbytes for index in self._indexes.values()),
+            "max_bytes": self.max_bytes,
+        }
+
+
+# Process-wide instance
+vector_index = VectorIndexCache()
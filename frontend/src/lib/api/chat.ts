@@ -23,7 +23,8 @@ export const streamChat = async (
                 agent_id: agentId,
                 message,
                 history,
-                thread_id: threadId
+                thread_id: threadId,
+                stream_mode: 'tokens'
             }),
         });
 
@@ -36,6 +37,10 @@ export const streamChat = async (
 
         if (!reader) throw new Error('No reader available');
 
+        // SSE frames end with a blank line; a read can stop mid-frame, so the unfinished
+        // tail is kept and completed by the next read
+        let buffer = '';
+
         while (true) {
             const { done, value } = await reader.read();
             if (done) {
@@ -43,12 +48,14 @@ export const streamChat = async (
                 break;
             }
 
-            const chunk = decoder.decode(value);
-            const lines = chunk.split('\n\n');
+            buffer += decoder.decode(value, { stream: true });
+            const frames = buffer.split('\n\n');
+            buffer = frames.pop() ?? '';
 
-            for (const line of lines) {
-                if (line.startsWith('data: ')) {
-                    const dataStr = line.replace('data: ', '');
+            for (const frame of frames) {
+                // Named events (route, tool_call, ...) start with `event:` and aren't chat content
+                if (frame.startsWith('data: ')) {
+                    const dataStr = frame.replace('data: ', '');
                     if (dataStr === '[DONE]') {
                         // Handle done logic if distinct from stream end
                     } else {